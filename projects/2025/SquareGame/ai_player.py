@@ -1,7 +1,11 @@
+from collections.abc import Sequence
+
 import torch
 import torch.nn as nn
-import copy
-import random
+import numpy as np
+from frozen_net import FrozenMLP, PopulationNet, genome_size, param_sizes, random_genomes
+from population_checkpoint import PopulationCheckpoint, save_population
+from checkpoint_writer import atomic_save
 
 class DodgeNet(nn.Module):
     """Neural network for the AI player"""
@@ -27,95 +31,262 @@ class DodgeNet(nn.Module):
         return action  # 0=left, 1=stay, 2=right
 
 
+def mutate_genomes(genomes, mutation_rate, mutation_scale, rng):
+    """Mutate a (count, genome_size) matrix in place.
+    Each parameter tensor of each genome gets Gaussian noise with probability mutation_rate.
+    """
+    sizes = param_sizes()
+    mutated = rng.random((genomes.shape[0], len(sizes))) < mutation_rate
+    mask = np.repeat(mutated, sizes, axis=1)
+    noise = rng.standard_normal(genomes.shape, dtype=np.float32) * np.float32(mutation_scale)
+    genomes += noise * mask
+
+
+def network_from_genome(genome):
+    """DodgeNet whose parameters are views into genome (no copy: they stay in sync)"""
+    network = DodgeNet()
+    flat = torch.from_numpy(genome)
+    offset = 0
+    for param in network.parameters():
+        size = param.numel()
+        param.data = flat[offset:offset + size].view_as(param)
+        offset += size
+    return network
+
+
 class AIAgent:
-    """An AI agent with its own neural network"""
-    def __init__(self, network=None):
-        if network is None:
-            self.network = DodgeNet()
-        else:
-            self.network = network
+    """An AI agent with its own neural network.
+
+    The weights live in a flat float32 genome (possibly a row of a population
+    matrix); the DodgeNet is only built when it is first needed and shares
+    memory with the genome. get_action uses a FrozenMLP over the same memory,
+    so acting needs no torch call.
+    """
+    def __init__(self, network=None, genome=None):
+        if genome is None:
+            network = network if network is not None else DodgeNet()
+            with torch.no_grad():
+                genome = nn.utils.parameters_to_vector(network.parameters()).numpy().copy()
+            network = None
+        self.genome = genome
+        self._network = network
+        self._policy = FrozenMLP.from_genome(genome)
         self.fitness = 0
         self.score = 0
 
+    @property
+    def network(self):
+        if self._network is None:
+            self._network = network_from_genome(self.genome)
+        return self._network
+
     def get_action(self, state):
-        return self.network.get_action(state)
+        return self._policy.get_action(state)
+
+    def get_genome(self):
+        """Network weights as a flat float32 vector"""
+        return self.genome.copy()
+
+    def set_genome(self, genome):
+        """Load network weights from a flat float32 vector"""
+        self.genome[:] = genome
 
     def clone(self):
         """Create a copy of this agent"""
-        new_network = DodgeNet()
-        new_network.load_state_dict(copy.deepcopy(self.network.state_dict()))
-        return AIAgent(new_network)
+        return AIAgent(genome=self.genome.copy())
 
-    def mutate(self, mutation_rate=0.1, mutation_scale=0.3):
+    def mutate(self, mutation_rate=0.1, mutation_scale=0.3, rng=None):
         """Mutate the network weights"""
-        with torch.no_grad():
-            for param in self.network.parameters():
-                if random.random() < mutation_rate:
-                    noise = torch.randn_like(param) * mutation_scale
-                    param.add_(noise)
+        rng = rng if rng is not None else np.random.default_rng()
+        mutate_genomes(self.genome[np.newaxis], mutation_rate, mutation_scale, rng)
+
+
+class PopulationAgent(AIAgent):
+    """View of one row of a NeuroEvolution population (genome and fitness)"""
+    def __init__(self, evolution, index):
+        self._evolution = evolution
+        self._index = index
+        super().__init__(genome=evolution.genomes[index])
+
+    @property
+    def fitness(self):
+        return self._evolution.fitness[self._index]
+
+    @fitness.setter
+    def fitness(self, value):
+        self._evolution.fitness[self._index] = value
+
+    @property
+    def score(self):
+        return self._evolution.scores[self._index]
+
+    @score.setter
+    def score(self, value):
+        self._evolution.scores[self._index] = value
+
+
+class PopulationView(Sequence):
+    """The rows of a NeuroEvolution population as agents, each built when it is
+    indexed, so a large population holds no per-agent objects"""
+    def __init__(self, evolution):
+        self._evolution = evolution
+
+    def __len__(self):
+        return self._evolution.population_size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("population index out of range")
+        return PopulationAgent(self._evolution, index)
 
 
 class NeuroEvolution:
-    """Genetic algorithm for evolving neural networks"""
-    def __init__(self, population_size=50, elite_size=10):
+    """Genetic algorithm for evolving neural networks.
+
+    The population is one (population_size, genome_size) float32 matrix, so
+    selection, cloning and mutation are array operations. population gives
+    PopulationAgent views of its rows, built on access, for code that works with agents.
+
+    evolve() replaces the whole population at once (generational). make_child()
+    and insert() are the steady-state alternative: one child at a time replaces
+    the worst member, so evaluations never wait for a generation to finish.
+    """
+    mutation_rate = 0.2
+    mutation_scale = 0.3
+
+    def __init__(self, population_size=50, elite_size=10, seed=None):
         self.population_size = population_size
         self.elite_size = elite_size
-        self.population = [AIAgent() for _ in range(population_size)]
+        self.rng = np.random.default_rng(seed)
+        self.genomes = random_genomes(population_size, self.rng)
+        self.fitness = np.zeros(population_size)
+        self.scores = np.zeros(population_size)
+        self.population = PopulationView(self)
         self.generation = 0
         self.best_fitness = 0
-        self.best_agent = None
+        self.best_genome = None
+        self.insertions = 0  # steady-state children inserted
+
+    @property
+    def best_agent(self):
+        return AIAgent(genome=self.best_genome) if self.best_genome is not None else None
+
+    def set_fitness(self, fitness, scores=None):
+        """Assign fitness (and optionally scores) to the whole population at once"""
+        self.fitness[:] = fitness
+        if scores is not None:
+            self.scores[:] = scores
 
     def evolve(self):
         """Evolve the population to the next generation"""
-        # Sort by fitness
-        self.population.sort(key=lambda x: x.fitness, reverse=True)
+        # Sort by fitness (stable, so ties keep population order)
+        order = np.argsort(-self.fitness, kind="stable")
 
         # Track best agent
-        if self.population[0].fitness > self.best_fitness:
-            self.best_fitness = self.population[0].fitness
-            self.best_agent = self.population[0].clone()
+        if self.fitness[order[0]] > self.best_fitness:
+            self.best_fitness = float(self.fitness[order[0]])
+            self.best_genome = self.genomes[order[0]].copy()
 
-        # Keep elite agents
-        new_population = []
-        for i in range(self.elite_size):
-            new_population.append(self.population[i].clone())
+        # Keep elite agents, then fill with mutated copies of random elites
+        elites = self.genomes[order[:self.elite_size]]
+        parents = self.rng.integers(0, self.elite_size, size=self.population_size - self.elite_size)
+        children = elites[parents]
+        mutate_genomes(children, self.mutation_rate, self.mutation_scale, self.rng)
 
-        # Create offspring from elite agents
-        while len(new_population) < self.population_size:
-            # Select parent from elite pool
-            parent = random.choice(self.population[:self.elite_size])
-            child = parent.clone()
+        # Written in place so the population views stay valid
+        self.genomes[:self.elite_size] = elites
+        self.genomes[self.elite_size:] = children
+        self.generation += 1
 
-            # Mutate child
-            mutation_rate = 0.2
-            mutation_scale = 0.3
-            child.mutate(mutation_rate, mutation_scale)
+        # Reset fitness for new generation
+        self.fitness[:] = 0
+        self.scores[:] = 0
 
-            new_population.append(child)
+    def make_child(self):
+        """Steady state: a mutated copy of a random elite of the current population"""
+        elites = np.argsort(-self.fitness, kind="stable")[:self.elite_size]
+        child = self.genomes[elites[self.rng.integers(self.elite_size)]][np.newaxis].copy()
+        mutate_genomes(child, self.mutation_rate, self.mutation_scale, self.rng)
+        return child[0]
 
-        self.population = new_population
-        self.generation += 1
+    def insert(self, genome, fitness, score=0):
+        """Steady state: an evaluated child replaces the worst member, unless it is worse.
+        Returns the index it took, or None. Every population_size insertions count as
+        one generation, so checkpoints and progress read the same in both modes.
+        """
+        if fitness > self.best_fitness:
+            self.best_fitness = float(fitness)
+            self.best_genome = np.array(genome, dtype=np.float32)
+        self.insertions += 1
+        if self.insertions % self.population_size == 0:
+            self.generation += 1
 
-        # Reset fitness for new generation
-        for agent in self.population:
-            agent.fitness = 0
-            agent.score = 0
+        worst = int(np.argmin(self.fitness))
+        if fitness < self.fitness[worst]:
+            return None
+        self.genomes[worst] = genome
+        self.fitness[worst] = fitness
+        self.scores[worst] = score
+        return worst
 
     def get_population(self):
         return self.population
 
     def get_best_agent(self):
-        return self.best_agent if self.best_agent else self.population[0]
+        return self.best_agent if self.best_genome is not None else self.population[0]
 
-    def save_best(self, filepath):
-        """Save the best agent's network"""
-        if self.best_agent:
-            torch.save(self.best_agent.network.state_dict(), filepath)
+    def save_best(self, filepath, writer=None):
+        """Save the best agent's network (in the background when a CheckpointWriter is given)"""
+        if self.best_genome is not None:
+            state = {k: v.detach().clone() for k, v in self.best_agent.network.state_dict().items()}
+            if writer is None:
+                atomic_save(torch.save, state, filepath)
+            else:
+                writer.submit(filepath, atomic_save, torch.save, state, filepath)
             print(f"Saved best agent to {filepath}")
 
+    def export_best(self, filepath):
+        """Save the best agent as a FrozenMLP .npz file (loadable without torch)"""
+        if self.best_genome is not None:
+            FrozenMLP.from_genome(self.best_genome).save(filepath)
+            print(f"Exported best agent to {filepath}")
+
+    def save_checkpoint(self, filepath, extra=None, writer=None):
+        """Save the whole population (genomes, fitness, generation, best genome
+        and RNG state) to one memory-mappable file, see population_checkpoint.py.
+        With a CheckpointWriter the arrays are copied now and written in the background."""
+        best_genome = self.best_genome.copy() if self.best_genome is not None else None
+        args = (filepath, self.genomes.copy(), self.fitness.copy(), self.scores.copy(), self.generation,
+                best_genome, self.best_fitness, self.elite_size, self.rng.bit_generator.state, extra)
+        if writer is None:
+            save_population(*args)
+        else:
+            writer.submit(filepath, save_population, *args)
+
+    @classmethod
+    def load_checkpoint(cls, filepath):
+        """Resume a population saved with save_checkpoint.
+        Returns (neuro_evo, extra) where extra is the dict given when saving.
+        """
+        with PopulationCheckpoint(filepath) as checkpoint:
+            evo = cls(population_size=checkpoint.population_size, elite_size=checkpoint.elite_size)
+            evo.genomes[:] = checkpoint.genomes
+            evo.fitness[:] = checkpoint.fitness
+            evo.scores[:] = checkpoint.scores
+            evo.generation = checkpoint.generation
+            evo.best_fitness = checkpoint.best_fitness
+            if checkpoint.best_genome is not None:
+                evo.best_genome = np.array(checkpoint.best_genome)
+            if checkpoint.rng_state is not None:
+                evo.rng.bit_generator.state = checkpoint.rng_state
+            return evo, checkpoint.extra
+
     def load_agent(self, filepath):
         """Load an agent from file"""
         network = DodgeNet()
         network.load_state_dict(torch.load(filepath))
         return AIAgent(network)
-
@@ -0,0 +1,289 @@
+"""
+Ape-X style distributed DQN on one machine: many actors, one replay process, one learner.
+
+- Actor processes each step their own DodgeVecEnv with a fixed epsilon
+  (eps_i = 0.4 ** (1 + 7 * i / (N - 1)), from greedy to very exploratory). They
+  act with a NumPy copy of policy_net (frozen_net.FrozenMLP, no torch calls),
+  compute an initial |TD error| for every transition with that copy and send
+  batches of transitions through a queue.
+- The replay process owns a PrioritizedReplayBuffer. It ingests actor batches
+  and answers the learner's requests (sample, priority update, stats) over a pipe.
+  With agent.n_step > 1 it builds the n-step transitions (every game of every
+  actor is one stream) and they enter at the highest priority instead.
+- The learner (the calling process) trains DQNAgent.policy_net on sampled
+  batches, asking for the next batch before training on the current one, and
+  publishes its weights to shared memory every publish_every updates; actors
+  pick them up between batches.
+
+Actors never wait for the learner, so frame throughput grows with the number of
+actor processes until the cores are used up.
+"""
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frozen_net import FrozenMLP
+from vec_env import DodgeVecEnv
+
+
+def actor_epsilons(num_actors, base=0.4, alpha=7.0):
+    """Ape-X exploration rates, one per actor"""
+    if num_actors == 1:
+        return [base]
+    return [base ** (1 + alpha * i / (num_actors - 1)) for i in range(num_actors)]
+
+
+class SharedWeights:
+    """policy_net weights in one shared-memory block with a version counter.
+
+    The learner publish()es, actors read() a consistent copy as a FrozenMLP
+    when version changed. Created before the actors are forked.
+    """
+    def __init__(self, state_dict):
+        self.layout = []
+        offset = 0
+        for name, value in state_dict.items():
+            shape = tuple(value.shape)
+            self.layout.append((name, shape, offset))
+            offset += int(np.prod(shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=offset * 4)
+        self._flat = np.ndarray((offset,), dtype=np.float32, buffer=self._shm.buf)
+        self._version = multiprocessing.Value("q", 0)
+        self.publish(state_dict)
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def publish(self, state_dict):
+        with self._version.get_lock():
+            for name, shape, offset in self.layout:
+                value = state_dict[name]
+                array = value.detach().cpu().numpy() if hasattr(value, "detach") else np.asarray(value)
+                self._flat[offset:offset + array.size] = array.ravel()
+            self._version.value += 1
+
+    def read(self):
+        """(FrozenMLP of the latest weights, their version)"""
+        with self._version.get_lock():
+            arrays = {name: self._flat[offset:offset + int(np.prod(shape))].reshape(shape).copy()
+                      for name, shape, offset in self.layout}
+            version = self._version.value
+        return FrozenMLP.from_state_dict(arrays), version
+
+    def close(self, unlink=False):
+        del self._flat
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _actor_main(epsilon, weights, transitions, stop, num_envs, steps_per_batch, max_time, gamma, seed,
+                action_repeat=1, first_stream=0):
+    """Act in num_envs games and send (transitions, |TD errors|, frames, finished scores, replay
+    streams of the games) batches. Rows are step-major: one row per game for every step."""
+    transitions.cancel_join_thread()  # may exit with batches still queued
+    rng = np.random.default_rng(seed)
+    env = DodgeVecEnv(num_envs, max_time=max_time, seed=seed, auto_reset=True, action_repeat=action_repeat)
+    rows = np.arange(num_envs)
+    streams = first_stream + rows
+    policy, version = weights.read()
+    obs = env.reset()
+    while not stop.is_set():
+        if weights.version != version:
+            policy, version = weights.read()
+        states, actions, rewards, next_states, dones, q_taken, scores = [], [], [], [], [], [], []
+        for _ in range(steps_per_batch):
+            q_values = policy.forward(obs)
+            action = q_values.argmax(axis=1)
+            explore = rng.random(num_envs) < epsilon
+            action[explore] = rng.integers(0, 3, size=int(explore.sum()))
+            next_obs, reward, done, info = env.step(action)
+
+            # Terminal transitions keep the last observation of the finished game
+            next_state = next_obs
+            if done.any():
+                next_state = next_obs.copy()
+                next_state[done] = info["final_obs"][done]
+                scores.extend(int(score) for score in info["scores"][done])
+            states.append(obs)
+            actions.append(action)
+            rewards.append(reward)
+            next_states.append(next_state)
+            dones.append(done)
+            q_taken.append(q_values[rows, action])
+            obs = next_obs
+
+        batch = (np.concatenate(states), np.concatenate(actions), np.concatenate(rewards).astype(np.float32),
+                 np.concatenate(next_states), np.concatenate(dones).astype(np.float32))
+        # Initial priority: TD error of the actor's own (slightly stale) network
+        target = batch[2] + gamma * policy.forward(batch[3]).max(axis=1) * (1.0 - batch[4])
+        td_errors = np.abs(target - np.concatenate(q_taken))
+        message = (*batch, td_errors, steps_per_batch * num_envs, scores, streams)
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                break
+            except queue.Full:
+                pass  # replay process is behind: wait instead of piling up memory
+
+
+def _replay_main(capacity, state_size, transitions, conn, stop, n_step=1, gamma=0.99):
+    """Replay server: ingest actor batches, answer learner requests until ("stop",)"""
+    from rl_dqn import PrioritizedReplayBuffer
+
+    buffer = PrioritizedReplayBuffer(capacity, state_size, n_step=n_step, gamma=gamma)
+    frames = 0
+    new_scores = []
+    while not stop.is_set():
+        busy = False
+        for _ in range(8):
+            try:
+                *batch, td_errors, batch_frames, scores, streams = transitions.get_nowait()
+            except queue.Empty:
+                break
+            if n_step > 1:
+                # Step by step into the n-step windows; new transitions start at max priority
+                for start in range(0, len(td_errors), len(streams)):
+                    buffer.push_batch(*(array[start:start + len(streams)] for array in batch), streams=streams)
+            else:
+                buffer.push_batch(*batch, td_errors=td_errors)
+            frames += batch_frames
+            new_scores.extend(scores)
+            busy = True
+        while conn.poll():
+            busy = True
+            message = conn.recv()
+            if message[0] == "sample":
+                conn.send(buffer.sample_arrays(message[1]) if len(buffer) >= message[1] else None)
+            elif message[0] == "priorities":
+                buffer.update_priorities(message[1], message[2])
+            elif message[0] == "stats":
+                conn.send((frames, new_scores, len(buffer)))
+                new_scores = []
+            elif message[0] == "stop":
+                return
+        if not busy:
+            time.sleep(0.0005)
+
+
+class ApexTrainer:
+    """Runs the actor and replay processes around a DQNAgent that learns here.
+
+    Use as a context manager (or call start()/stop()).
+    """
+    def __init__(self, agent, num_actors=4, envs_per_actor=8, steps_per_batch=32, max_time=20000,
+                 capacity=100_000, batch_size=64, publish_every=100, target_update_every=1000, seed=None,
+                 action_repeat=1):
+        self.agent = agent
+        self.num_actors = num_actors
+        self.envs_per_actor = envs_per_actor
+        self.steps_per_batch = steps_per_batch
+        self.max_time = max_time
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.publish_every = publish_every
+        self.target_update_every = target_update_every
+        self.seed = seed
+        self.action_repeat = action_repeat
+        self.epsilons = actor_epsilons(num_actors)
+        self.updates = 0
+        self.frames = 0
+        self.last_loss = 0.0
+        self._processes = []
+
+    def start(self):
+        self._weights = SharedWeights(self.agent.policy_net.state_dict())
+        self._transitions = multiprocessing.Queue(maxsize=4 * self.num_actors)
+        self._conn, replay_conn = multiprocessing.Pipe()
+        self._stop = multiprocessing.Event()
+        state_size = self.agent.policy_net.net[0].in_features
+        replay = multiprocessing.Process(target=_replay_main, name="apex-replay", daemon=True,
+                                         args=(self.capacity, state_size, self._transitions, replay_conn, self._stop,
+                                               self.agent.n_step, self.agent.gamma))
+        self._processes = [replay]
+        seeds = np.random.SeedSequence(self.seed).generate_state(self.num_actors)
+        for i, epsilon in enumerate(self.epsilons):
+            self._processes.append(multiprocessing.Process(
+                target=_actor_main, name=f"apex-actor-{i}", daemon=True,
+                args=(epsilon, self._weights, self._transitions, self._stop, self.envs_per_actor,
+                      self.steps_per_batch, self.max_time, self.agent.gamma, int(seeds[i]), self.action_repeat,
+                      i * self.envs_per_actor),
+            ))
+        for process in self._processes:
+            process.start()
+        return self
+
+    def stats(self):
+        """(total actor steps, i.e. transitions, scores of games finished since the last call, replay size).
+        With action_repeat every step covers that many game frames."""
+        self._conn.send(("stats",))
+        frames, scores, size = self._recv()
+        self.frames = frames
+        return frames, scores, size
+
+    def train(self, episodes, log_every=50, writer=None, checkpoint_path=None, start_episode=0, best=0):
+        """Learn until the actors have finished `episodes` games. Every log_every games
+        the policy (and a checkpoint when checkpoint_path is set) is saved, through
+        writer when one is given. Returns the best score."""
+        agent = self.agent
+        start_steps = agent.step_count  # restored from a checkpoint on resume
+        finished = start_episode
+        next_log = (finished // log_every + 1) * log_every
+        self._conn.send(("sample", self.batch_size))
+        while finished < episodes:
+            batch = self._recv()
+            if batch is None or self.updates % 50 == 0:
+                frames, scores, _ = self.stats()
+                agent.step_count = start_steps + frames
+                if scores:
+                    finished += len(scores)
+                    best = max(best, max(scores))
+            self._conn.send(("sample", self.batch_size))  # prepared while we train on this one
+            if batch is None:
+                time.sleep(0.01)  # replay still filling up
+                continue
+
+            self.last_loss, td_errors = agent.learn(batch)
+            self._conn.send(("priorities", batch[-1], td_errors))
+            self.updates += 1
+            if self.updates % self.publish_every == 0:
+                self._weights.publish(agent.policy_net.state_dict())
+            if self.updates % self.target_update_every == 0:
+                agent.update_target()
+
+            if finished >= next_log:
+                print(f"Ep {finished}/{episodes} | best {best} | frames {self.frames} | "
+                      f"updates {self.updates} | actors {self.num_actors}")
+                agent.save("best_rl_dqn.pth", writer=writer)
+                if checkpoint_path:
+                    agent.save_checkpoint(checkpoint_path, extra={"episode": finished, "best": best}, writer=writer)
+                next_log = (finished // log_every + 1) * log_every
+        self._recv()  # the last prefetched batch
+        return best
+
+    def _recv(self):
+        while not self._conn.poll(1.0):
+            if not self._processes[0].is_alive():
+                raise RuntimeError("Ape-X replay process exited unexpectedly")
+        return self._conn.recv()
+
+    def stop(self):
+        if not self._processes:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._weights.close(unlink=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,298 @@
+"""
+Performance benchmarks for the Dodge game, the networks and training.
+
+Runs every benchmark (or those named with --only), prints a table and writes
+the results as JSON. Each result has a value, a unit and whether higher is
+better, so two runs can be compared:
+
+    python benchmark.py --save-baseline               # record benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json --threshold 0.1
+
+--compare exits with status 1 if any benchmark is more than threshold
+(relative) worse than the baseline. Baselines are machine specific; record
+one before a change and compare after it on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+
+import numpy as np
+import torch
+
+from ai_player import DodgeNet, NeuroEvolution, PopulationNet, random_genomes
+from dodge_sim import DodgeGame, STATE_SIZE, make_spawn_tapes
+from evaluator_pool import EvaluatorPool, evaluate_genomes
+from frozen_net import FrozenMLP, genome_size
+from rl_dqn import DQNNet, ReplayBuffer, PrioritizedReplayBuffer
+from train_ai import agent_fitness
+from vec_env import DodgeVecEnv
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+BATCH_SIZE = 256  # "batch N" for the inference benchmarks
+
+
+def time_per_call(fn, repeat=5):
+    """Best-of-repeat seconds per call of fn(), timeit style (each repeat takes >= 0.2s)"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def result(value, unit, higher_is_better):
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_env_single(quick):
+    """Frames per second of one DodgeGame with a random policy"""
+    frames = 5_000 if quick else 50_000
+    rng = random.Random(0)
+    game = DodgeGame(rng=rng)
+    start = time.perf_counter()
+    for _ in range(frames):
+        if game.game_over:
+            game.reset()
+        game.update()
+        game.observe()
+        game.act(rng.randrange(3))
+        game.clock.tick()
+    return result(frames / (time.perf_counter() - start), "frames/s", True)
+
+
+def bench_env_batched(quick, num_envs=BATCH_SIZE):
+    """Game frames per second of DodgeVecEnv (all games counted)"""
+    steps = 200 if quick else 2_000
+    env = DodgeVecEnv(num_envs, seed=0, auto_reset=True)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 3, size=(steps, num_envs))
+    env.reset()
+    start = time.perf_counter()
+    for t in range(steps):
+        env.step(actions[t])
+    return result(steps * num_envs / (time.perf_counter() - start), "frames/s", True)
+
+
+def bench_dodgenet_action(quick):
+    """Latency of DodgeNet.get_action on one state"""
+    net = DodgeNet()
+    state = np.random.default_rng(0).random(STATE_SIZE, dtype=np.float32)
+    return result(time_per_call(lambda: net.get_action(state), repeat=3 if quick else 5) * 1e6, "us", False)
+
+
+def bench_frozen_action(quick):
+    """Latency of FrozenMLP.get_action (NumPy DodgeNet) on one state"""
+    net = FrozenMLP.from_state_dict(DodgeNet().state_dict())
+    state = np.random.default_rng(0).random(STATE_SIZE, dtype=np.float32)
+    return result(time_per_call(lambda: net.get_action(state), repeat=3 if quick else 5) * 1e6, "us", False)
+
+
+def bench_frozen_dqn_action(quick):
+    """Latency of FrozenMLP.get_action (NumPy DQNNet) on one state"""
+    net = FrozenMLP.from_state_dict(DQNNet().state_dict())
+    state = np.random.default_rng(0).random(STATE_SIZE, dtype=np.float32)
+    return result(time_per_call(lambda: net.get_action(state), repeat=3 if quick else 5) * 1e6, "us", False)
+
+
+def _forward_latency(net, batch, quick):
+    x = torch.rand(batch, STATE_SIZE)
+
+    def forward():
+        with torch.no_grad():
+            net(x)
+    return result(time_per_call(forward, repeat=3 if quick else 5) * 1e6, "us", False)
+
+
+def bench_dodgenet_batch(quick):
+    """Latency of one DodgeNet forward pass on BATCH_SIZE states"""
+    return _forward_latency(DodgeNet(), BATCH_SIZE, quick)
+
+
+def bench_population_net(quick):
+    """Latency of PopulationNet.get_actions for 50 genomes, one state each"""
+    net = PopulationNet(random_genomes(50, np.random.default_rng(0)))
+    states = np.random.default_rng(1).random((50, STATE_SIZE), dtype=np.float32)
+    return result(time_per_call(lambda: net.get_actions(states), repeat=3 if quick else 5) * 1e6, "us", False)
+
+
+def bench_dqn_forward_1(quick):
+    """Latency of one DQNNet forward pass on a single state"""
+    return _forward_latency(DQNNet(), 1, quick)
+
+
+def bench_dqn_forward_batch(quick):
+    """Latency of one DQNNet forward pass on BATCH_SIZE states"""
+    return _forward_latency(DQNNet(), BATCH_SIZE, quick)
+
+
+def _fill(buffer, rng):
+    n = buffer.capacity
+    buffer.push_batch(
+        rng.random((n, STATE_SIZE), dtype=np.float32), rng.integers(0, 3, size=n),
+        rng.random(n, dtype=np.float32), rng.random((n, STATE_SIZE), dtype=np.float32),
+        np.zeros(n, dtype=np.float32),
+    )
+    return buffer
+
+
+def bench_replay_sample(quick):
+    """Transitions per second drawn by ReplayBuffer.sample(64) from a full buffer"""
+    buffer = _fill(ReplayBuffer(100_000), np.random.default_rng(0))
+    seconds = time_per_call(lambda: buffer.sample(64), repeat=3 if quick else 5)
+    return result(64 / seconds, "samples/s", True)
+
+
+def bench_prioritized_sample(quick):
+    """Transitions per second drawn by PrioritizedReplayBuffer.sample(64) from a full buffer"""
+    buffer = _fill(PrioritizedReplayBuffer(100_000), np.random.default_rng(0))
+    seconds = time_per_call(lambda: buffer.sample(64), repeat=3 if quick else 5)
+    return result(64 / seconds, "samples/s", True)
+
+
+def _bench_evolve(population_size):
+    def bench(quick):
+        evo = NeuroEvolution(population_size=population_size, elite_size=population_size // 5, seed=0)
+        rng = np.random.default_rng(0)
+
+        def step():
+            evo.set_fitness(rng.random(population_size))
+            evo.evolve()
+        return result(time_per_call(step, repeat=3 if quick else 5) * 1e3, "ms", False)
+    bench.__doc__ = f"NeuroEvolution.set_fitness + evolve with a population of {population_size}"
+    return bench
+
+
+def bench_train_ai_generation(quick):
+    """Wall time of one in-process train_ai generation (50 genomes, evaluate + evolve)"""
+    max_time = 5000 if quick else 30000
+    evo = NeuroEvolution(population_size=50, elite_size=10, seed=0)
+    start = time.perf_counter()
+    scores, movements = evaluate_genomes(evo.genomes, max_time=max_time, explore_eps=0.2, seed=0)
+    evo.set_fitness(agent_fitness(scores, movements), scores)
+    evo.evolve()
+    return result(time.perf_counter() - start, "s", False)
+
+
+def bench_train_ai_generation_pool(quick):
+    """Wall time of one train_ai generation as train_ai runs it (50 genomes, EvaluatorPool, one spawn tape)"""
+    max_time = 5000 if quick else 30000
+    evo = NeuroEvolution(population_size=50, elite_size=10, seed=0)
+    with EvaluatorPool(genome_size(), evo.population_size) as pool:  # started once per run, not timed
+        start = time.perf_counter()
+        tapes = make_spawn_tapes(1, max_time, evo.rng)
+        seed = int(evo.rng.integers(2 ** 31))
+        scores, movements = pool.evaluate(evo.genomes, max_time=max_time, explore_eps=0.2, seed=seed, tapes=tapes)
+        evo.set_fitness(agent_fitness(scores, movements), scores)
+        evo.evolve()
+        return result(time.perf_counter() - start, "s", False)
+
+
+BENCHMARKS = {
+    "env_single_fps": bench_env_single,
+    "env_batched_fps": bench_env_batched,
+    "dodgenet_action_1": bench_dodgenet_action,
+    "dodgenet_forward_batch": bench_dodgenet_batch,
+    "frozen_action_1": bench_frozen_action,
+    "frozen_dqn_action_1": bench_frozen_dqn_action,
+    "population_net_actions": bench_population_net,
+    "dqn_forward_1": bench_dqn_forward_1,
+    "dqn_forward_batch": bench_dqn_forward_batch,
+    "replay_sample": bench_replay_sample,
+    "prioritized_replay_sample": bench_prioritized_sample,
+    "evolve_50": _bench_evolve(50),
+    "evolve_500": _bench_evolve(500),
+    "evolve_5000": _bench_evolve(5000),
+    "train_ai_generation": bench_train_ai_generation,
+    "train_ai_generation_pool": bench_train_ai_generation_pool,
+}
+
+
+def run_benchmarks(names=None, quick=False, verbose=True):
+    """Run the named benchmarks (all by default). Returns a results document."""
+    names = list(BENCHMARKS) if names is None else names
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {name!r}, choose from {', '.join(BENCHMARKS)}")
+        results[name] = BENCHMARKS[name](quick)
+        if verbose:
+            print(f"  {name:<28} {results[name]['value']:>14.2f} {results[name]['unit']}")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": quick,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+        },
+        "results": results,
+    }
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """Compare two results documents benchmark by benchmark.
+    Returns a list of (name, baseline_value, current_value, relative_change, regressed)
+    where relative_change > 0 always means "better" and regressed means worse
+    than the baseline by more than threshold.
+    """
+    rows = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or before["value"] == 0:
+            continue
+        change = (now["value"] - before["value"]) / before["value"]
+        if not now["higher_is_better"]:
+            change = -change
+        rows.append((name, before["value"], now["value"], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dodge performance benchmarks")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, noisier numbers")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH",
+                        help=f"also write the results as a baseline (default {DEFAULT_BASELINE})")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown that counts as a regression (default 0.1)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, bench in BENCHMARKS.items():
+            print(f"{name:<28} {bench.__doc__}")
+        return 0
+
+    print("Running benchmarks...")
+    current = run_benchmarks(args.only, quick=args.quick)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare_results(current, baseline, args.threshold)
+        print(f"\nCompared with {args.compare} (threshold {args.threshold:.0%}):")
+        for name, before, now, change, regressed in rows:
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"  {name:<28} {before:>14.2f} -> {now:>14.2f}  {change:+7.1%}  {flag}")
+        if any(row[4] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
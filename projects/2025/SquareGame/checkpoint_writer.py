@@ -0,0 +1,89 @@
+"""
+Background checkpoint writing for the training loops.
+
+The training thread takes an in-memory snapshot (copies of weights, optimizer
+state, arrays) and hands it to CheckpointWriter.submit(); serialising and
+writing happen on the writer thread. If a newer snapshot for the same file
+arrives before the older one was written, only the newer one is written.
+
+atomic_save() writes to a temporary file and renames it over the target, so
+readers (and a resume after a crash) only ever see complete files.
+"""
+import os
+import threading
+
+
+def atomic_save(save_fn, obj, filepath):
+    """save_fn(obj, tmp_path), fsync, then rename tmp_path over filepath"""
+    tmp_path = f"{filepath}.tmp"
+    save_fn(obj, tmp_path)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+
+class CheckpointWriter:
+    """One thread that runs submitted write jobs in order, latest job per key.
+
+    Use as a context manager (or call close()) so pending writes are finished;
+    close() re-raises the first write error.
+    """
+    def __init__(self):
+        self._pending = {}  # key -> (fn, args); dicts keep submission order
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self.error = None
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, fn, *args):
+        """Run fn(*args) on the writer thread; replaces a not yet started job with the same key"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("CheckpointWriter is closed")
+            self._pending.pop(key, None)
+            self._pending[key] = (fn, args)
+            self._cond.notify_all()
+
+    def flush(self):
+        """Block until every submitted job has been written"""
+        with self._cond:
+            while self._pending or self._busy:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("Checkpoint write failed") from self.error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return  # closed and drained
+                key = next(iter(self._pending))
+                fn, args = self._pending.pop(key)
+                self._busy = True
+            try:
+                fn(*args)
+                self.written += 1
+            except Exception as exc:
+                if self.error is None:
+                    self.error = exc
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
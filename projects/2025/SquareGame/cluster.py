@@ -0,0 +1,271 @@
+"""
+Fitness evaluation on several machines over TCP.
+
+train_ai (the coordinator) listens on a port; worker processes on any number
+of hosts connect to it and pull work:
+
+    python cluster.py worker --host 192.168.1.10 --port 6000 --processes 8
+
+The coordinator's evaluate() has the same signature as EvaluatorPool.evaluate.
+It splits the population into batches of genome ids. A worker receives the
+genome matrix, the settings and the spawn tapes once per generation; after that
+every request carries only (start, end, seed) and every reply one batch of
+(score, movement_count) rows. Games are deterministic given the seed (and
+tapes), so any worker returns the same rows for a batch.
+
+Fault handling:
+- a worker whose connection drops has its unfinished batches re-queued;
+- when the queue is empty, idle workers also get copies of batches that have
+  been running for more than straggler_after seconds, and the first result wins.
+
+Messages are pickled (multiprocessing.connection), so whoever knows the authkey
+can run code on the other side. There is no default key: pass the same secret
+to Coordinator(authkey=...) and --authkey, or set it in the DODGE_CLUSTER_AUTHKEY
+environment variable on every host. The coordinator listens on 127.0.0.1
+unless given another address; bind it to a LAN interface only on a trusted
+network.
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+DEFAULT_PORT = 6000
+AUTHKEY_ENV = "DODGE_CLUSTER_AUTHKEY"
+
+
+def resolve_authkey(authkey=None):
+    """authkey as bytes, or the DODGE_CLUSTER_AUTHKEY environment variable when it is None.
+    Raises ValueError when neither gives a key."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"No cluster authkey: pass one or set the {AUTHKEY_ENV} environment variable")
+    return authkey.encode() if isinstance(authkey, str) else bytes(authkey)
+
+
+class Coordinator:
+    """Serves evaluation batches to remote workers (see run_worker).
+
+    Use as a context manager (or call close()) so workers are told to stop and
+    the port is released.
+    """
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), authkey=None, batch_size=8,
+                 straggler_after=30.0):
+        self.batch_size = batch_size
+        self.straggler_after = straggler_after
+        self._listener = Listener(address, authkey=resolve_authkey(authkey))
+        self.address = self._listener.address
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = 0
+        self._generation = 0
+        self._job = None  # (genomes, max_time, explore_eps, games_per_agent, tapes, action_repeat) of the generation
+        self._queue = deque()  # batch ids waiting for a worker
+        self._running = {}  # batch id -> {worker id: start time}
+        self._batches = []  # batch id -> (start, end, seed)
+        self._done = set()
+        self._results = None
+        threading.Thread(target=self._accept_loop, name="cluster-accept", daemon=True).start()
+
+    @property
+    def worker_count(self):
+        with self._cond:
+            return self._workers
+
+    def wait_for_workers(self, count=1, timeout=None):
+        """Block until at least count workers are connected; returns whether they are"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._workers >= count, timeout)
+
+    def evaluate(self, genomes, max_time=30000, explore_eps=0.0, games_per_agent=1, seed=None, tapes=None,
+                 action_repeat=1, profiler=None):
+        """Score a (pop_size, n_params) genome matrix on the connected workers.
+        Returns (scores, movement_counts) like EvaluatorPool.evaluate; blocks
+        until every batch has a result (workers may join at any time).
+        profiler is accepted for the same signature; remote games are not profiled.
+        """
+        pop_size = len(genomes)
+        genomes = np.ascontiguousarray(genomes, dtype=np.float32)
+        tapes = None if tapes is None else np.asarray(tapes, dtype=np.int64)
+        with self._cond:
+            self._generation += 1
+            self._job = (genomes, max_time, explore_eps, games_per_agent, tapes, action_repeat)
+            self._batches = []
+            for start in range(0, pop_size, self.batch_size):
+                end = min(start + self.batch_size, pop_size)
+                # Same seeding as EvaluatorPool: common with tapes, per batch otherwise
+                batch_seed = seed if seed is None or tapes is not None else seed + start
+                self._batches.append((start, end, batch_seed))
+            self._queue = deque(range(len(self._batches)))
+            self._running = {}
+            self._done = set()
+            self._results = np.zeros((pop_size, 2))
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: len(self._done) == len(self._batches) or self._closed)
+            if self._closed:
+                raise RuntimeError("Coordinator closed during evaluation")
+            results = self._results.copy()
+        return results[:, 0], results[:, 1]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _accept_loop(self):
+        worker_id = 0
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # listener closed
+            except Exception:
+                continue  # failed handshake (wrong authkey), keep serving
+            worker_id += 1
+            threading.Thread(target=self._serve, args=(conn, worker_id), name=f"cluster-worker-{worker_id}",
+                             daemon=True).start()
+
+    def _serve(self, conn, worker_id):
+        """One worker's request/reply loop; its batches are re-queued if it drops"""
+        with self._cond:
+            self._workers += 1
+            self._cond.notify_all()
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "result":
+                    self._store(*message[1:])
+                conn.send(self._next_task(worker_id, message[-1]))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self._cond:
+                self._workers -= 1
+                for batch, holders in self._running.items():
+                    holders.pop(worker_id, None)
+                    if not holders and batch not in self._done and batch not in self._queue:
+                        self._queue.appendleft(batch)
+                self._cond.notify_all()
+
+    def _store(self, generation, batch, scores, moves, _known_generation):
+        with self._cond:
+            if generation != self._generation or batch in self._done:
+                return  # late copy of a batch that is already in
+            start, end, _ = self._batches[batch]
+            self._results[start:end, 0] = scores
+            self._results[start:end, 1] = moves
+            self._done.add(batch)
+            self._running.pop(batch, None)
+            self._cond.notify_all()
+
+    def _next_task(self, worker_id, known_generation, wait=1.0):
+        """("work", ...) for the next batch, ("stop",), or ("wait", 0) when no
+        batch turned up within wait seconds (the worker then asks again)"""
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                if self._closed:
+                    return ("stop",)
+                batch = self._queue.popleft() if self._queue else self._straggler(worker_id)
+                if batch is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return ("wait", 0.0)
+                self._cond.wait(remaining)
+            self._running.setdefault(batch, {})[worker_id] = time.monotonic()
+            start, end, seed = self._batches[batch]
+            job = self._job if known_generation != self._generation else None
+            return ("work", self._generation, batch, start, end, seed, job)
+
+    def _straggler(self, worker_id):
+        """A running batch that has taken longer than straggler_after, for a second worker"""
+        now = time.monotonic()
+        for batch, holders in self._running.items():
+            if worker_id not in holders and holders and now - min(holders.values()) > self.straggler_after:
+                return batch
+        return None
+
+
+def run_worker(address, authkey=None, connect_timeout=60.0):
+    """Connect to a Coordinator and evaluate batches until it says stop.
+    authkey: the coordinator's secret (default: DODGE_CLUSTER_AUTHKEY).
+    Returns the number of batches evaluated."""
+    from evaluator_pool import evaluate_genomes  # imported here so the coordinator side stays light
+
+    authkey = resolve_authkey(authkey)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(tuple(address), authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+    generation, job, evaluated = None, None, 0
+    try:
+        conn.send(("pull", generation))
+        while True:
+            task = conn.recv()
+            if task[0] == "stop":
+                break
+            if task[0] == "wait":
+                time.sleep(task[1])
+                conn.send(("pull", generation))
+                continue
+            _, task_generation, batch, start, end, seed, task_job = task
+            if task_job is not None:
+                generation, job = task_generation, task_job
+            genomes, max_time, explore_eps, games_per_agent, tapes, action_repeat = job
+            scores, moves = evaluate_genomes(genomes[start:end], max_time, explore_eps, games_per_agent, seed, tapes,
+                                             action_repeat)
+            evaluated += 1
+            conn.send(("result", task_generation, batch, scores, moves, generation))
+    except (EOFError, OSError):
+        pass  # coordinator went away
+    finally:
+        conn.close()
+    return evaluated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dodge evaluation worker for a train_ai coordinator")
+    parser.add_argument("role", choices=["worker"])
+    parser.add_argument("--host", default="127.0.0.1", help="coordinator host")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="coordinator port")
+    parser.add_argument("--authkey", help=f"shared secret of the coordinator (default: ${AUTHKEY_ENV})")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes to start on this host (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    address = (args.host, args.port)
+    try:
+        authkey = resolve_authkey(args.authkey)
+    except ValueError as e:
+        parser.error(str(e))
+    workers = [multiprocessing.Process(target=run_worker, args=(address, authkey)) for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    print(f"{len(workers)} workers serving {args.host}:{args.port}")
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,19 @@
 import pygame
-import random
 import sys
-from ai_player import AIAgent, DodgeNet
-import torch
+from dodge_sim import DodgeGame, SIM_FPS
+from dodge_render import Renderer, WallClock, GREEN
+from frozen_net import FrozenMLP
 
-# Initialize Pygame
-pygame.init()
-
-# Constants
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-PLAYER_WIDTH = 50
-PLAYER_HEIGHT = 50
-OBJECT_WIDTH = 40
-OBJECT_HEIGHT = 40
-PLAYER_SPEED = 7
-OBJECT_SPEED = 5
-FPS = 60
-
-# Colors
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-
-# Setup screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("AI Demo - Dodge Game")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
-
-class Player:
-    def __init__(self):
-        self.x = SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2
-        self.y = SCREEN_HEIGHT - PLAYER_HEIGHT - 20
-        self.width = PLAYER_WIDTH
-        self.height = PLAYER_HEIGHT
-        self.speed = PLAYER_SPEED
-
-    def move(self, direction):
-        if direction == "left" and self.x > 0:
-            self.x -= self.speed
-        elif direction == "right" and self.x < SCREEN_WIDTH - self.width:
-            self.x += self.speed
-
-    def draw(self):
-        pygame.draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-class FallingObject:
-    def __init__(self, speed_multiplier=1.0):
-        self.x = random.randint(0, SCREEN_WIDTH - OBJECT_WIDTH)
-        self.y = -OBJECT_HEIGHT
-        self.width = OBJECT_WIDTH
-        self.height = OBJECT_HEIGHT
-        self.speed = OBJECT_SPEED * speed_multiplier
-
-    def update(self):
-        self.y += self.speed
-
-    def draw(self):
-        pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-    def is_off_screen(self):
-        return self.y > SCREEN_HEIGHT
-
-def check_collision(player, objects):
-    player_rect = player.get_rect()
-    for obj in objects:
-        if player_rect.colliderect(obj.get_rect()):
-            return True
-    return False
-
-def get_state(player, falling_objects):
-    """Extract state features for the neural network"""
-    closest_objects = sorted(falling_objects, key=lambda obj: obj.y, reverse=True)[:3]
-
-    while len(closest_objects) < 3:
-        closest_objects.append(type('obj', (), {
-            'x': SCREEN_WIDTH // 2,
-            'y': -100,
-            'speed': 0
-        })())
-
-    state = [
-        player.x / SCREEN_WIDTH,
-        player.x / SCREEN_WIDTH - 0.5,
-    ]
-
-    for i in range(2):
-        obj = closest_objects[i]
-        state.extend([
-            obj.x / SCREEN_WIDTH,
-            obj.y / SCREEN_HEIGHT,
-            (obj.x - player.x) / SCREEN_WIDTH,
-        ])
-
-    return state
+FPS = SIM_FPS
+ACTION_REPEAT = 1  # the action_repeat the model was trained with; drawing stays at every frame
 
 def load_ai_agent(filepath):
-    """Load a trained AI agent"""
+    """Load a trained AI agent (a frozen .npz runs without torch)"""
     try:
+        if filepath.endswith(".npz"):
+            return FrozenMLP.load(filepath)
+        import torch
+        from ai_player import AIAgent, DodgeNet
         network = DodgeNet()
         network.load_state_dict(torch.load(filepath))
         return AIAgent(network)
@@ -115,98 +22,56 @@ def load_ai_agent(filepath):
         return None
 
 def main():
-    # Try to load the best agent
-    agent = load_ai_agent("best_agent_final.pth")
-    if agent is None:
-        agent = load_ai_agent("best_agent_gen_10.pth")
+    # A model given on the command line (e.g. best_es_final.npz), else the best agent
+    if len(sys.argv) > 1:
+        agent = load_ai_agent(sys.argv[1])
+    else:
+        agent = load_ai_agent("best_agent_final.npz")
+        if agent is None:
+            agent = load_ai_agent("best_agent_final.pth")
+        if agent is None:
+            agent = load_ai_agent("best_agent_gen_10.pth")
     if agent is None:
         print("No trained model found. Run train_ai.py first!")
-        pygame.quit()
         sys.exit()
 
-    player = Player()
-    falling_objects = []
-    score = 0
-    game_over = False
-    start_time = pygame.time.get_ticks()
-    last_spawn_time = pygame.time.get_ticks()
+    renderer = Renderer("AI Demo - Dodge Game")
+    game = DodgeGame(clock=WallClock())
 
+    hold = 0  # frames left before the agent decides again
     running = True
     while running:
-        clock.tick(FPS)
-
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            elif event.type == pygame.KEYDOWN and game_over:
+            elif event.type == pygame.KEYDOWN and game.game_over:
                 if event.key == pygame.K_SPACE:
                     # Restart
-                    player = Player()
-                    falling_objects = []
-                    score = 0
-                    game_over = False
-                    start_time = pygame.time.get_ticks()
-                    last_spawn_time = pygame.time.get_ticks()
-
-        if not game_over:
-            # Update score
-            current_time = pygame.time.get_ticks()
-            score = (current_time - start_time) // 1000
-
-            # Calculate difficulty
-            speed_multiplier = 1.0 + (score * 0.1)
-            spawn_interval = max(300, 1000 - score * 30)
+                    game.reset()
+                    hold = 0
 
-            # Spawn falling objects
-            if current_time - last_spawn_time > spawn_interval:
-                falling_objects.append(FallingObject(speed_multiplier))
-                last_spawn_time = current_time
+        if not game.game_over:
+            game.update()
 
-            # Update falling objects
-            for obj in falling_objects[:]:
-                obj.update()
-                if obj.is_off_screen():
-                    falling_objects.remove(obj)
-
-            # AI makes decision
-            state = get_state(player, falling_objects)
-            action = agent.get_action(state)
-
-            if action == 0:
-                player.move("left")
-            elif action == 2:
-                player.move("right")
-
-            # Check collisions
-            if check_collision(player, falling_objects):
-                game_over = True
+            # AI makes decision (kept for ACTION_REPEAT frames), then moves and checks collisions
+            if hold == 0:
+                action = agent.get_action(game.observe())
+                hold = ACTION_REPEAT
+            hold -= 1
+            game.act(action)
 
         # Drawing
-        screen.fill(WHITE)
-
-        if not game_over:
-            player.draw()
-            for obj in falling_objects:
-                obj.draw()
-
-            score_text = font.render(f"Score: {score}", True, BLACK)
-            ai_text = small_font.render("AI Playing", True, GREEN)
-            screen.blit(score_text, (10, 10))
-            screen.blit(ai_text, (10, 50))
+        if not game.game_over:
+            renderer.draw_game(game, GREEN)
+            renderer.draw_text(f"Score: {game.score}", (10, 10))
+            renderer.draw_text("AI Playing", (10, 50), GREEN, small=True)
         else:
-            game_over_text = font.render("GAME OVER!", True, RED)
-            final_score_text = font.render(f"Final Score: {score}", True, BLACK)
-            restart_text = small_font.render("Press SPACE to restart", True, BLACK)
-
-            screen.blit(game_over_text, (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2 - 50))
-            screen.blit(final_score_text, (SCREEN_WIDTH // 2 - 120, SCREEN_HEIGHT // 2))
-            screen.blit(restart_text, (SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT // 2 + 50))
+            renderer.draw_game_over(game.score, small_hint=True)
 
-        pygame.display.flip()
+        renderer.show(FPS)
 
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,89 @@
+"""
+Optional pygame front end for dodge_sim.DodgeGame.
+
+Importing this module does not open a window; the display is created by the
+first Renderer (or get_renderer() call). Training code only imports it when it
+actually renders, so headless runs never need pygame's video driver.
+"""
+import pygame
+
+from dodge_sim import SCREEN_WIDTH, SCREEN_HEIGHT
+
+# Colors
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+BLUE = (0, 100, 255)
+GREEN = (0, 255, 0)
+YELLOW = (255, 255, 0)
+
+
+class WallClock:
+    """Real-time clock with the SimClock interface, for interactive play.
+    Frame pacing is done by Renderer.show(), so tick() has nothing to do.
+    """
+    def get_ticks(self):
+        return pygame.time.get_ticks()
+
+    def tick(self):
+        pass
+
+
+class Renderer:
+    """Game window: draws a DodgeGame, text and the game over screen"""
+    def __init__(self, caption="Dodge Game"):
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption(caption)
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 36)
+        self.small_font = pygame.font.Font(None, 24)
+
+    def poll_quit(self):
+        """Drain the event queue. Returns True if the window was closed."""
+        return any(event.type == pygame.QUIT for event in pygame.event.get())
+
+    def clear(self):
+        self.screen.fill(WHITE)
+
+    def draw_game(self, game, player_color=BLUE):
+        self.clear()
+        player = game.player
+        pygame.draw.rect(self.screen, player_color, (player.x, player.y, player.width, player.height))
+        for obj in game.obstacles:
+            pygame.draw.rect(self.screen, RED, (obj.x, obj.y, obj.width, obj.height))
+
+    def draw_text(self, text, pos, color=BLACK, small=False):
+        font = self.small_font if small else self.font
+        self.screen.blit(font.render(text, True, color), pos)
+
+    def draw_game_over(self, score, small_hint=False):
+        self.clear()
+        self.draw_text("GAME OVER!", (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2 - 50), RED)
+        self.draw_text(f"Final Score: {score}", (SCREEN_WIDTH // 2 - 120, SCREEN_HEIGHT // 2))
+        hint_x = SCREEN_WIDTH // 2 - (150 if small_hint else 180)
+        self.draw_text("Press SPACE to restart", (hint_x, SCREEN_HEIGHT // 2 + 50), small=small_hint)
+
+    def show(self, fps=None):
+        """Flip the frame to the screen, then wait so at most fps frames are shown per second"""
+        pygame.display.flip()
+        if fps:
+            self.clock.tick(fps)
+
+
+_renderer = None
+
+
+def get_renderer(caption="Dodge Game"):
+    """Shared window, created on first use"""
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer(caption)
+    return _renderer
+
+
+def close_renderer():
+    global _renderer
+    if _renderer is not None:
+        _renderer = None
+        pygame.quit()
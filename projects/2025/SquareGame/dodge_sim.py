@@ -0,0 +1,314 @@
+"""
+Headless Dodge game core: rules, player, obstacles and observations.
+
+Nothing here imports pygame, so training code and worker processes can run
+games without a display. Drawing is done by dodge_render.py on top of DodgeGame.
+"""
+import random
+
+import numpy as np
+
+# Game constants (same values as main.py)
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+PLAYER_WIDTH = 50
+PLAYER_HEIGHT = 50
+OBJECT_WIDTH = 40
+OBJECT_HEIGHT = 40
+PLAYER_SPEED = 7
+OBJECT_SPEED = 5
+PLAYER_START_X = SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2
+PLAYER_Y = SCREEN_HEIGHT - PLAYER_HEIGHT - 20
+
+# Actions (network output index)
+LEFT, STAY, RIGHT = 0, 1, 2
+
+# Simulated frames per second. Matches the real-time game in main.py so that
+# agents trained headless see the same per-frame physics they are deployed in.
+SIM_FPS = 60
+
+# DQN survival reward per simulated second (vs. -50 for a collision). The old
+# wall-clock trainer gave 1/600 per frame, so 0.1 per second at SIM_FPS keeps
+# the per-frame reward, and its ratio to the collision penalty, unchanged.
+SURVIVE_REWARD_PER_SECOND = 0.1
+
+
+class SimClock:
+    """Fixed-timestep clock that replaces pygame.time.get_ticks() in training.
+
+    Every frame advances the clock by exactly 1000 / fps milliseconds, so
+    score, difficulty and spawn timing depend only on the number of simulated
+    frames and not on how fast (or how loaded) the machine is.
+    """
+    def __init__(self, fps=SIM_FPS):
+        self.fps = fps
+        self.dt_ms = 1000.0 / fps
+        self.frame = 0
+
+    def get_ticks(self):
+        """Simulated milliseconds since the clock was created"""
+        return int(self.frame * self.dt_ms)
+
+    def tick(self):
+        """Advance the clock by one frame"""
+        self.frame += 1
+
+
+# State padding used when fewer than 2 objects are on screen
+PAD_X = SCREEN_WIDTH // 2
+PAD_Y = -100
+STATE_SIZE = 8
+
+
+class Player:
+    def __init__(self):
+        self.x = PLAYER_START_X
+        self.y = PLAYER_Y
+        self.width = PLAYER_WIDTH
+        self.height = PLAYER_HEIGHT
+        self.speed = PLAYER_SPEED
+
+    def move(self, action):
+        if action == LEFT and self.x > 0:
+            self.x -= self.speed
+        elif action == RIGHT and self.x < SCREEN_WIDTH - self.width:
+            self.x += self.speed
+
+
+def update_objects(objects, recycle=None):
+    """Move all objects, keep the list ordered lowest-first and drop off-screen ones.
+
+    objects stays sorted by y, descending, across frames: new objects spawn at
+    the top so append() keeps the order, and after a move only objects that
+    overtook a slower one are out of place, which one insertion-sort pass fixes
+    in about O(n). Off-screen objects are then always at the front.
+    Removed objects are appended to recycle when it is given.
+    """
+    for obj in objects:
+        obj.update()
+    for i in range(1, len(objects)):
+        obj = objects[i]
+        j = i
+        while j > 0 and objects[j - 1].y < obj.y:
+            objects[j] = objects[j - 1]
+            j -= 1
+        objects[j] = obj
+    off_screen = 0
+    while off_screen < len(objects) and objects[off_screen].y > SCREEN_HEIGHT:
+        off_screen += 1
+    if off_screen:
+        if recycle is not None:
+            recycle.extend(objects[:off_screen])
+        del objects[:off_screen]
+
+
+class Obstacle:
+    """Falling object without a __dict__; instances are reused by ObstaclePool"""
+    __slots__ = ("x", "y", "speed")
+    width = OBJECT_WIDTH
+    height = OBJECT_HEIGHT
+
+    def __init__(self):
+        self.x = 0
+        self.y = 0.0
+        self.speed = 0.0
+
+    def update(self):
+        self.y += self.speed
+
+
+class ObstaclePool:
+    """Falling objects of one game, allocated once and recycled.
+
+    Live obstacles are kept in y order (lowest first, see update_objects);
+    off-screen ones go back to a free list instead of being garbage, so a
+    running game allocates nothing per spawn. Iterating, indexing and len()
+    see the live obstacles, which is what ObservationBuilder reads.
+    """
+    def __init__(self, capacity=64):
+        self._free = [Obstacle() for _ in range(capacity)]
+        self.active = []
+
+    def spawn(self, x, speed):
+        obj = self._free.pop() if self._free else Obstacle()
+        obj.x = x
+        obj.y = -OBJECT_HEIGHT
+        obj.speed = speed
+        self.active.append(obj)  # spawns are the highest object, order is kept
+        return obj
+
+    def update(self):
+        update_objects(self.active, recycle=self._free)
+
+    def clear(self):
+        self._free.extend(self.active)
+        self.active.clear()
+
+    def collides(self, player_x, player_y=PLAYER_Y, player_width=PLAYER_WIDTH, player_height=PLAYER_HEIGHT):
+        """AABB test against the obstacles in the player's y-band only.
+
+        Same result as pygame.Rect.colliderect (coordinates truncated to int).
+        Obstacles are scanned lowest first: those below the player are skipped
+        and the scan stops at the first one entirely above it, so usually only
+        one or two obstacles are compared.
+        """
+        band_bottom = player_y + player_height
+        for obj in self.active:
+            y = int(obj.y)
+            if y >= band_bottom:
+                continue
+            if y + OBJECT_HEIGHT <= player_y:
+                break
+            if player_x < obj.x + OBJECT_WIDTH and obj.x < player_x + player_width:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.active)
+
+    def __iter__(self):
+        return iter(self.active)
+
+    def __getitem__(self, index):
+        return self.active[index]
+
+
+class ObservationBuilder:
+    """Builds the 8-feature network input from a y-ordered object list.
+
+    Reads the two lowest objects straight from the front of the list kept by
+    update_objects (no sort, no padding objects) and writes into two
+    preallocated arrays used alternately, so a state stays valid while the
+    next one is built (e.g. state and next_state of one transition).
+    """
+    def __init__(self):
+        self._buffers = (np.zeros(STATE_SIZE, dtype=np.float32), np.zeros(STATE_SIZE, dtype=np.float32))
+        self._next = 0
+
+    def build(self, player, objects):
+        state = self._buffers[self._next]
+        self._next ^= 1
+        px = player.x
+        state[0] = px / SCREEN_WIDTH  # Player position (normalized)
+        state[1] = px / SCREEN_WIDTH - 0.5  # Player position relative to center
+        for i in range(2):
+            if i < len(objects):
+                ox, oy = objects[i].x, objects[i].y
+            else:
+                ox, oy = PAD_X, PAD_Y
+            state[2 + 3 * i] = ox / SCREEN_WIDTH  # Object x position
+            state[3 + 3 * i] = oy / SCREEN_HEIGHT  # Object y position
+            state[4 + 3 * i] = (ox - px) / SCREEN_WIDTH  # Relative x distance
+        return state
+
+
+def spawn_schedule(max_time, fps=SIM_FPS):
+    """(spawn times in ms, speed multipliers) of every object spawned within max_time.
+
+    Spawn timing and speed only depend on the simulated clock, never on what
+    the player does, so they are the same for every game of a given length;
+    only the x positions are random (see make_spawn_tapes).
+    """
+    clock = SimClock(fps)
+    times, multipliers = [], []
+    last_spawn = 0
+    while clock.get_ticks() <= max_time:
+        now = clock.get_ticks()
+        score = now // 1000
+        if now - last_spawn > max(300, 1000 - score * 30):
+            times.append(now)
+            multipliers.append(1.0 + score * 0.1)
+            last_spawn = now
+        clock.tick()
+    return np.array(times, dtype=np.int64), np.array(multipliers)
+
+
+def make_spawn_tapes(count, max_time, rng, fps=SIM_FPS):
+    """(count, spawns) int array of pre-drawn spawn x positions ("tapes").
+
+    Games that play the same tape face the same obstacles at the same times,
+    so agents are compared under common random numbers. A tape covers every
+    spawn of a game of up to max_time ms. rng is a numpy Generator.
+    """
+    length = len(spawn_schedule(max_time, fps)[0])
+    return rng.integers(0, SCREEN_WIDTH - OBJECT_WIDTH + 1, size=(count, length), dtype=np.int64)
+
+
+class DodgeGame:
+    """One game of Dodge: the rules shared by main.py, the demos and training.
+
+    A frame is update() (score, difficulty, spawning, obstacle movement), then
+    observe() if an agent is playing, then act(action) (player move and
+    collision). The caller owns the loop and calls clock.tick() once per frame.
+    update() is spawn() + obstacles.update() and act() is move_player() +
+    check_collision(), for loops that time the phases separately.
+
+    clock: anything with get_ticks() and tick(); a SimClock by default, or
+    dodge_render.WallClock for real-time play.
+    rng: source of spawn positions (the random module by default).
+    tape: optional spawn tape (see make_spawn_tapes); the k-th object then
+    spawns at tape[k] instead of a random x, so games can be replayed exactly.
+    """
+    def __init__(self, clock=None, rng=None, tape=None):
+        self.clock = clock if clock is not None else SimClock()
+        self.rng = rng if rng is not None else random
+        self.tape = tape
+        self.obstacles = ObstaclePool()
+        self.observations = ObservationBuilder()
+        self.reset()
+
+    def reset(self):
+        self.player = Player()
+        self.obstacles.clear()
+        self.score = 0
+        self.movement_count = 0
+        self.game_over = False
+        self.start_time = self.clock.get_ticks()
+        self.last_spawn_time = self.start_time
+        self.spawn_count = 0
+
+    @property
+    def elapsed(self):
+        """Milliseconds since the game started"""
+        return self.clock.get_ticks() - self.start_time
+
+    def update(self):
+        self.spawn()
+        self.obstacles.update()  # kept ordered by y, off-screen ones recycled
+
+    def spawn(self):
+        """Score and difficulty from the clock, and a new object when one is due"""
+        current_time = self.clock.get_ticks()
+        self.score = (current_time - self.start_time) // 1000
+
+        # Difficulty: objects fall 10% faster every second and spawn faster, minimum 0.3s
+        speed_multiplier = 1.0 + (self.score * 0.1)
+        spawn_interval = max(300, 1000 - self.score * 30)
+
+        if current_time - self.last_spawn_time > spawn_interval:
+            if self.tape is not None:
+                x = int(self.tape[self.spawn_count])
+            else:
+                x = self.rng.randint(0, SCREEN_WIDTH - OBJECT_WIDTH)
+            self.obstacles.spawn(x, OBJECT_SPEED * speed_multiplier)
+            self.last_spawn_time = current_time
+            self.spawn_count += 1
+
+    def observe(self):
+        """8-feature state for the networks (buffer reused every other call)"""
+        return self.observations.build(self.player, self.obstacles)
+
+    def act(self, action):
+        """Move the player (0=left, 1=stay, 2=right). Returns True on collision."""
+        self.move_player(action)
+        return self.check_collision()
+
+    def move_player(self, action):
+        if action != STAY:
+            self.player.move(action)
+            self.movement_count += 1
+
+    def check_collision(self):
+        if self.obstacles.collides(self.player.x, self.player.y):
+            self.game_over = True
+        return self.game_over
@@ -0,0 +1,436 @@
+"""
+Long-lived worker pool for scoring NeuroEvolution genomes.
+
+The pool is started once per training run. Every generation the parent writes
+the population as a (pop_size, n_params) float32 matrix into a shared-memory
+block and only sends (start, end, settings) ranges through the task queue; the
+workers write (score, movement_count) rows into a second shared block. No
+nn.Module is pickled and no process is started per generation. Workers run
+the networks with NumPy (frozen_net.PopulationNet) and make no torch calls.
+
+For steady-state evolution, submit() and next_result() score one genome per
+task instead, and SteadyStateEvaluator keeps every worker busy with children.
+For Evolution Strategies, evaluate_perturbations() shares theta once and sends
+only perturbation seeds; workers rebuild the noise themselves.
+
+Given a PhaseProfiler, evaluate() and next_result() have the workers time
+every frame phase of their games and send the aggregates back with each
+result; the pool merges them into that profiler, so its phase times are summed
+over all workers, like evaluate_genomes() profiling in this process.
+"""
+import multiprocessing
+import queue
+import random
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from dodge_sim import DodgeGame, SimClock, SIM_FPS
+from evolution_strategies import perturbed_genomes
+from frozen_net import FrozenMLP, PopulationNet
+from phase_profiler import NULL_PROFILER, PhaseProfiler
+from vec_env import DodgeVecEnv
+
+
+def evaluate_genomes(genomes, max_time=30000, explore_eps=0.0, games_per_agent=1, seed=None, tapes=None,
+                     action_repeat=1, profiler=None):
+    """Play every genome in lockstep on a DodgeVecEnv (games_per_agent games each).
+    Returns (scores, movement_counts) arrays, averaged over each genome's games.
+
+    tapes: optional (T, spawns) spawn tapes (dodge_sim.make_spawn_tapes). Every
+    genome then plays each of the T tapes once (games_per_agent is T), and the
+    exploration draws are shared too, so all genomes face the same conditions.
+    action_repeat: frames each chosen action is held for (see DodgeVecEnv).
+    profiler: optional PhaseProfiler; every step is one frame of it (policy,
+    then DodgeVecEnv's phases).
+    """
+    profiler = profiler or NULL_PROFILER
+    pop_size = len(genomes)
+    if tapes is not None:
+        games_per_agent = len(tapes)
+    net = PopulationNet(genomes)
+    env = DodgeVecEnv(pop_size * games_per_agent, max_time=max_time, seed=seed, tapes=tapes,
+                      action_repeat=action_repeat, profiler=profiler)
+    rng = np.random.default_rng(seed)
+
+    obs = env.reset()
+    finished = np.zeros(env.num_envs, dtype=bool)
+    scores = np.zeros(env.num_envs, dtype=np.int64)
+    moves = np.zeros(env.num_envs, dtype=np.int64)
+    while not finished.all():
+        profiler.start()
+        actions = net.get_actions(obs.reshape(pop_size, games_per_agent, -1)).reshape(-1)
+        # Epsilon exploration (small random actions to escape local optima)
+        if explore_eps > 0.0:
+            if tapes is not None:
+                # Common random numbers: the same draws for game g of every genome
+                explore = np.tile(rng.random(games_per_agent) < explore_eps, pop_size)
+                random_actions = np.tile(rng.integers(0, 3, size=games_per_agent), pop_size)
+                actions[explore] = random_actions[explore]
+            else:
+                explore = rng.random(env.num_envs) < explore_eps
+                actions[explore] = rng.integers(0, 3, size=int(explore.sum()))
+        profiler.lap("policy")
+        obs, _, dones, info = env.step(actions)
+        scores[dones] = info["scores"][dones]
+        moves[dones] = info["moves"][dones]
+        finished |= dones
+
+    scores = scores.reshape(pop_size, games_per_agent).mean(axis=1)
+    moves = moves.reshape(pop_size, games_per_agent).mean(axis=1)
+    return scores, moves
+
+
+def evaluate_perturbations(theta, seeds, sigma, max_time=30000, seed=None, tapes=None):
+    """Play theta + sigma * eps and theta - sigma * eps for the perturbation of
+    every seed (see evolution_strategies). Returns (scores, movement_counts),
+    each of shape (len(seeds), 2) with the + game first.
+    """
+    genomes = perturbed_genomes(theta, seeds, sigma)
+    scores, moves = evaluate_genomes(genomes, max_time, 0.0, 1, seed, tapes)
+    return scores.reshape(-1, 2), moves.reshape(-1, 2)
+
+
+def play_genome(genome, max_time=30000, explore_eps=0.0, seed=None, tape=None, action_repeat=1, profiler=None):
+    """One headless game of one genome on the scalar engine, which is much faster
+    than a one-row DodgeVecEnv. Same episode as train_ai.run_game_episode with
+    the same seed and tape. Returns (score, movement_count).
+    profiler: optional PhaseProfiler, with the phases of run_game_episode.
+    """
+    rng = random.Random(seed)
+    profiler = profiler or NULL_PROFILER
+    policy = FrozenMLP.from_genome(genome)
+    game = DodgeGame(SimClock(SIM_FPS), rng, tape)
+    while not game.game_over and game.elapsed <= max_time:
+        profiler.start()
+        game.spawn()
+        profiler.lap("spawn")
+        game.obstacles.update()
+        profiler.lap("update")
+        if game.clock.frame % action_repeat == 0:
+            state = game.observe()
+            profiler.lap("observe")
+            action = policy.get_action(state)
+            if explore_eps > 0.0 and rng.random() < explore_eps:
+                action = rng.choice([0, 1, 2])
+            profiler.lap("policy")
+        game.act(action)
+        profiler.lap("collision")
+        game.clock.tick()
+    return game.score, game.movement_count
+
+
+def race_genomes(evaluate, genomes, tapes, stages, fitness_fn=None, **kwargs):
+    """Successive halving: spend the later, more expensive evaluations on the best genomes.
+
+    tapes: (T, spawns) spawn tapes (dodge_sim.make_spawn_tapes).
+    stages: ((max_time, num_tapes, keep), ...), e.g. ((30000, 1, 1.0), (30000, 3, 0.3)):
+    in each stage the best keep fraction of the whole population (by
+    fitness_fn(scores, moves), default the scores) plays tapes[:num_tapes] for
+    max_time ms. When max_time does not change only the new tapes are played and
+    averaged in; a longer max_time replays every tape. evaluate is evaluate_genomes
+    or EvaluatorPool.evaluate; kwargs (explore_eps, seed) go to every call.
+
+    Returns (scores, movement_counts, stage_reached): every genome keeps its
+    average from the last stage it played. Raises ValueError unless num_tapes
+    grows (strictly while max_time stays the same) from 1 up to len(tapes).
+    """
+    prev_tapes, prev_time = 0, None
+    for max_time, num_tapes, _ in stages:
+        least = prev_tapes + 1 if max_time == prev_time else max(prev_tapes, 1)
+        if not least <= num_tapes <= len(tapes):
+            raise ValueError(f"Race stages need num_tapes from 1 up to the {len(tapes)} tapes, growing "
+                             f"while max_time stays the same, got {[tuple(stage) for stage in stages]}")
+        prev_tapes, prev_time = num_tapes, max_time
+    pop_size = len(genomes)
+    scores = np.zeros(pop_size)
+    moves = np.zeros(pop_size)
+    reached = np.zeros(pop_size, dtype=np.int64)
+    alive = np.arange(pop_size)
+    played, prev_time = 0, None
+    for stage, (max_time, num_tapes, keep) in enumerate(stages):
+        count = max(1, int(np.ceil(keep * pop_size)))
+        if stage > 0 and count < len(alive):
+            fitness = scores[alive] if fitness_fn is None else fitness_fn(scores[alive], moves[alive])
+            alive = alive[np.argsort(-fitness, kind="stable")[:count]]
+        if max_time != prev_time:
+            played = 0
+        new_scores, new_moves = evaluate(genomes[alive], max_time=max_time, tapes=tapes[played:num_tapes], **kwargs)
+        weight = (num_tapes - played) / num_tapes
+        scores[alive] = scores[alive] * (1 - weight) + new_scores * weight
+        moves[alive] = moves[alive] * (1 - weight) + new_moves * weight
+        reached[alive] = stage
+        played, prev_time = num_tapes, max_time
+    return scores, moves, reached
+
+
+def _worker_main(genome_name, result_name, capacity, n_params, tasks, done):
+    """Worker loop: score genome rows [start, end), one row for a "child" task,
+    or the perturbations of theta (row 0) for an "es" task, until a None task arrives"""
+    genome_shm = shared_memory.SharedMemory(name=genome_name)
+    result_shm = shared_memory.SharedMemory(name=result_name)
+    genomes = np.ndarray((capacity, n_params), dtype=np.float32, buffer=genome_shm.buf)
+    results = np.ndarray((capacity, 2), dtype=np.float64, buffer=result_shm.buf)
+    tape_shm = None
+    tapes = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            if task[0] == "child":
+                _, slot, max_time, explore_eps, seed, action_repeat, profile = task
+                profiler = PhaseProfiler() if profile else None
+                try:
+                    results[slot] = play_genome(genomes[slot], max_time, explore_eps, seed,
+                                                action_repeat=action_repeat, profiler=profiler)
+                    done.put((slot, None, profiler and profiler.take()[0]))
+                except Exception:
+                    done.put((slot, traceback.format_exc(), None))
+                continue
+            kind, start, end, max_time, explore_eps, games_per_agent, seed, tape_info = task[:8]
+            try:
+                tapes = None
+                profiler = None
+                if tape_info is not None:
+                    tape_name, tape_shape = tape_info
+                    if tape_shm is None or tape_shm.name != tape_name:
+                        if tape_shm is not None:
+                            tape_shm.close()
+                        tape_shm = shared_memory.SharedMemory(name=tape_name)
+                    tapes = np.ndarray(tape_shape, dtype=np.int64, buffer=tape_shm.buf)
+                if kind == "es":
+                    seeds, sigma = task[8:]
+                    scores, moves = evaluate_perturbations(genomes[0], seeds, sigma, max_time, seed, tapes)
+                    results[2 * start:2 * end, 0] = scores.ravel()
+                    results[2 * start:2 * end, 1] = moves.ravel()
+                else:
+                    action_repeat, profile = task[8:]
+                    profiler = PhaseProfiler() if profile else None
+                    scores, moves = evaluate_genomes(genomes[start:end], max_time, explore_eps, games_per_agent,
+                                                     seed, tapes, action_repeat, profiler)
+                    results[start:end, 0] = scores
+                    results[start:end, 1] = moves
+                done.put((start, None, profiler and profiler.take()[0]))
+            except Exception:
+                done.put((start, traceback.format_exc(), None))
+    finally:
+        del genomes, results, tapes
+        genome_shm.close()
+        result_shm.close()
+        if tape_shm is not None:
+            tape_shm.close()
+
+
+class EvaluatorPool:
+    """Persistent processes that score up to capacity genomes of n_params floats.
+
+    Use as a context manager (or call close()) so the workers and the shared
+    memory blocks are released. evaluate() and submit() share the genome rows,
+    so do not call evaluate() while submitted genomes are pending.
+    """
+    def __init__(self, n_params, capacity, processes=None):
+        self.n_params = n_params
+        self.capacity = capacity
+        self.processes = processes or multiprocessing.cpu_count()
+
+        self._genome_shm = shared_memory.SharedMemory(create=True, size=capacity * n_params * 4)
+        self._result_shm = shared_memory.SharedMemory(create=True, size=capacity * 2 * 8)
+        self.genomes = np.ndarray((capacity, n_params), dtype=np.float32, buffer=self._genome_shm.buf)
+        self.results = np.ndarray((capacity, 2), dtype=np.float64, buffer=self._result_shm.buf)
+
+        self._tape_shm = None  # created by the first evaluate() with tapes
+        self._tasks = multiprocessing.Queue()
+        self._done = multiprocessing.Queue()
+        self._workers = []
+        for _ in range(self.processes):
+            worker = multiprocessing.Process(
+                target=_worker_main,
+                args=(self._genome_shm.name, self._result_shm.name, capacity, n_params, self._tasks, self._done),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def evaluate(self, genomes, max_time=30000, explore_eps=0.0, games_per_agent=1, seed=None, tapes=None,
+                 action_repeat=1, profiler=None):
+        """Score a (pop_size, n_params) genome matrix.
+        Returns (scores, movement_counts) arrays of length pop_size.
+        tapes: optional spawn tapes shared by every genome (see evaluate_genomes);
+        they are copied into shared memory once and read by all workers.
+        profiler: optional PhaseProfiler that receives the workers' frame phases.
+        """
+        pop_size = len(genomes)
+        if pop_size > self.capacity:
+            raise ValueError(f"Population of {pop_size} exceeds pool capacity {self.capacity}")
+        self.genomes[:pop_size] = genomes
+        tape_info = None if tapes is None else self._share_tapes(tapes)
+
+        # A few chunks per worker so fast chunks do not wait for the slowest one
+        bounds = np.linspace(0, pop_size, min(pop_size, self.processes * 2) + 1).astype(int)
+        chunks = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        for start, end in chunks:
+            # With tapes every chunk uses the same seed, so exploration draws are common too
+            chunk_seed = seed if seed is None or tapes is not None else seed + int(start)
+            self._tasks.put(("batch", int(start), int(end), max_time, explore_eps, games_per_agent, chunk_seed,
+                             tape_info, action_repeat, profiler is not None))
+
+        errors = []
+        for _ in chunks:
+            _, error, phases = self._wait()
+            if error is not None:
+                errors.append(error)
+            elif phases and profiler is not None:
+                profiler.merge(phases)
+        if errors:
+            raise RuntimeError("Evaluator worker failed:\n" + errors[0])
+
+        results = self.results[:pop_size].copy()
+        return results[:, 0], results[:, 1]
+
+    def evaluate_perturbations(self, theta, seeds, sigma, max_time=30000, seed=None, tapes=None):
+        """Pooled evaluate_perturbations(): theta is written to shared memory once,
+        each task carries only a chunk of seeds, and workers write two (score,
+        movement_count) rows per seed back. 2 * len(seeds) must fit the capacity.
+        """
+        count = len(seeds)
+        if 2 * count > self.capacity:
+            raise ValueError(f"{count} perturbation pairs exceed pool capacity {self.capacity}")
+        self.genomes[0] = theta
+        tape_info = None if tapes is None else self._share_tapes(tapes)
+
+        bounds = np.linspace(0, count, min(count, self.processes * 2) + 1).astype(int)
+        chunks = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        for start, end in chunks:
+            chunk_seed = seed if seed is None or tapes is not None else seed + int(start)
+            self._tasks.put(("es", int(start), int(end), max_time, 0.0, 1, chunk_seed, tape_info,
+                             [int(s) for s in seeds[start:end]], sigma))
+        errors = [error for _, error, _ in (self._wait() for _ in chunks) if error is not None]
+        if errors:
+            raise RuntimeError("Evaluator worker failed:\n" + errors[0])
+
+        results = self.results[:2 * count].copy()
+        return results[:, 0].reshape(-1, 2), results[:, 1].reshape(-1, 2)
+
+    def submit(self, slot, genome, max_time=30000, explore_eps=0.0, seed=None, action_repeat=1, profile=False):
+        """Queue one genome in row slot (0 <= slot < capacity) for a single game;
+        collect it with next_result(). A slot must not be reused before its result is in.
+        profile: time the game's phases for next_result(profiler=...)."""
+        self.genomes[slot] = genome
+        self._tasks.put(("child", int(slot), max_time, explore_eps, seed, action_repeat, profile))
+
+    def next_result(self, profiler=None):
+        """Block until any submitted genome finishes. Returns (slot, score, movement_count);
+        the phases of a profiled game are merged into profiler"""
+        slot, error, phases = self._wait()
+        if error is not None:
+            raise RuntimeError("Evaluator worker failed:\n" + error)
+        if phases and profiler is not None:
+            profiler.merge(phases)
+        score, moves = self.results[slot]
+        return slot, score, moves
+
+    def _wait(self):
+        while True:
+            try:
+                return self._done.get(timeout=1.0)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError("Evaluator worker exited unexpectedly")
+
+    def _share_tapes(self, tapes):
+        tapes = np.asarray(tapes, dtype=np.int64)
+        if self._tape_shm is None or self._tape_shm.size < tapes.nbytes:
+            if self._tape_shm is not None:
+                self._tape_shm.close()
+                self._tape_shm.unlink()
+            self._tape_shm = shared_memory.SharedMemory(create=True, size=tapes.nbytes)
+        np.ndarray(tapes.shape, dtype=np.int64, buffer=self._tape_shm.buf)[:] = tapes
+        return self._tape_shm.name, tapes.shape
+
+    def close(self):
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+        del self.genomes, self.results
+        self._genome_shm.close()
+        self._genome_shm.unlink()
+        self._result_shm.close()
+        self._result_shm.unlink()
+        if self._tape_shm is not None:
+            self._tape_shm.close()
+            self._tape_shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SteadyStateEvaluator:
+    """Asynchronous steady-state evolution on an EvaluatorPool.
+
+    Every worker always has a child to play: when a result comes back the child
+    is inserted into the population (replacing the worst member, see
+    NeuroEvolution.insert) and a new child of the updated population is
+    submitted right away. Children stay in flight between run() calls, so there
+    is no generation barrier at all. Without a pool the children are played one
+    by one in this process.
+
+    fitness_fn(score, moves) turns a game result into fitness (default: the score).
+    profiler: optional PhaseProfiler for the frame phases of the children's games
+    (summed over the workers).
+    """
+    def __init__(self, evolution, pool=None, fitness_fn=None, max_time=30000, in_flight=None, action_repeat=1,
+                 profiler=None):
+        self.evolution = evolution
+        self.pool = pool
+        self.fitness_fn = fitness_fn
+        self.max_time = max_time
+        self.action_repeat = action_repeat
+        self.profiler = profiler
+        if pool is not None:
+            in_flight = min(pool.capacity, in_flight or 2 * pool.processes)
+        self._free_slots = list(range(in_flight or 1))
+        self._pending = {}  # slot -> child genome
+
+    def run(self, count, explore_eps=0.0):
+        """Play and insert count children. Returns their (scores, movement_counts)"""
+        scores = np.zeros(count)
+        moves = np.zeros(count)
+        for i in range(count):
+            if self.pool is None:
+                genome = self.evolution.make_child()
+                scores[i], moves[i] = play_genome(genome, self.max_time, explore_eps, self._seed(),
+                                                  action_repeat=self.action_repeat, profiler=self.profiler)
+            else:
+                while self._free_slots:
+                    slot = self._free_slots.pop()
+                    self._pending[slot] = self.evolution.make_child()
+                    self.pool.submit(slot, self._pending[slot], self.max_time, explore_eps, self._seed(),
+                                     self.action_repeat, self.profiler is not None)
+                slot, scores[i], moves[i] = self.pool.next_result(self.profiler)
+                genome = self._pending.pop(slot)
+                self._free_slots.append(slot)
+            self._insert(genome, scores[i], moves[i])
+        return scores, moves
+
+    def drain(self):
+        """Wait for the children still in flight and insert them"""
+        while self._pending:
+            slot, score, moves = self.pool.next_result(self.profiler)
+            self._insert(self._pending.pop(slot), score, moves)
+            self._free_slots.append(slot)
+
+    def _insert(self, genome, score, moves):
+        fitness = score if self.fitness_fn is None else self.fitness_fn(score, moves)
+        self.evolution.insert(genome, fitness, score)
+
+    def _seed(self):
+        return int(self.evolution.rng.integers(2 ** 31))
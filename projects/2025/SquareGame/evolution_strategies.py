@@ -0,0 +1,150 @@
+"""
+OpenAI-style Evolution Strategies over the flat DodgeNet parameter vector.
+
+Every generation samples `pairs` Gaussian perturbations eps and scores both
+theta + sigma * eps and theta - sigma * eps (antithetic sampling). The returns
+are replaced by centered ranks (fitness shaping), so only their order matters,
+not their scale, and the resulting gradient estimate drives an Adam step.
+
+A perturbation is identified by its RNG seed alone: perturbation(seed, size)
+rebuilds eps in any process. Workers therefore need theta once per generation
+and a list of seeds, and send back one pair of returns per seed, however large
+the network is. tell() is deterministic, so a process that starts from the same
+theta and replays the same (seeds, returns) ends up with the same theta.
+Only NumPy is needed.
+
+    es = EvolutionStrategy(pairs=50, seed=0)
+    seeds = es.ask()
+    returns = ...  # (pairs, 2): return of theta + sigma*eps and of theta - sigma*eps per seed
+    es.tell(seeds, returns)
+"""
+import io
+import json
+
+import numpy as np
+
+from checkpoint_writer import atomic_save
+from frozen_net import random_genomes
+
+
+def perturbation(seed, size):
+    """Standard normal float32 noise vector of the given seed"""
+    return np.random.default_rng(seed).standard_normal(size, dtype=np.float32)
+
+
+def perturbed_genomes(theta, seeds, sigma):
+    """(2 * len(seeds), len(theta)) matrix: rows 2i and 2i + 1 are
+    theta + sigma * eps_i and theta - sigma * eps_i"""
+    genomes = np.empty((2 * len(seeds), len(theta)), dtype=np.float32)
+    for i, seed in enumerate(seeds):
+        noise = np.float32(sigma) * perturbation(int(seed), len(theta))
+        np.add(theta, noise, out=genomes[2 * i])
+        np.subtract(theta, noise, out=genomes[2 * i + 1])
+    return genomes
+
+
+def centered_ranks(returns):
+    """Ranks of returns scaled to [-0.5, 0.5], same shape. Equal returns share
+    their mean rank, so a tied antithetic pair contributes nothing."""
+    flat = np.asarray(returns, dtype=np.float64).ravel()
+    if len(flat) < 2:
+        return np.zeros(np.shape(returns))
+    _, inverse = np.unique(flat, return_inverse=True)
+    ranks = np.empty(len(flat))
+    ranks[np.argsort(flat, kind="stable")] = np.arange(len(flat))
+    mean_ranks = np.bincount(inverse, weights=ranks) / np.bincount(inverse)
+    return (mean_ranks[inverse] / (len(flat) - 1) - 0.5).reshape(np.shape(returns))
+
+
+def _write_bytes(data, filepath):
+    with open(filepath, "wb") as f:
+        f.write(data)
+
+
+class EvolutionStrategy:
+    """Antithetic, rank-shaped ES with an Adam update.
+
+    theta is the current (mean) genome; best_genome/best_fitness are kept by
+    the training loop, like NeuroEvolution's, for the best theta it measured.
+    """
+    def __init__(self, pairs=50, sigma=0.3, learning_rate=0.1, weight_decay=0.005, seed=None, theta=None):
+        self.pairs = pairs
+        self.sigma = sigma
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.rng = np.random.default_rng(seed)
+        self.theta = random_genomes(1, self.rng)[0] if theta is None else np.array(theta, dtype=np.float32)
+        self.m = np.zeros_like(self.theta)
+        self.v = np.zeros_like(self.theta)
+        self.steps = 0
+        self.generation = 0
+        self.best_fitness = 0
+        self.best_genome = None
+
+    @property
+    def population_size(self):
+        return 2 * self.pairs
+
+    def ask(self):
+        """Seeds of this generation's perturbations"""
+        return self.rng.integers(0, 2 ** 31, size=self.pairs)
+
+    def tell(self, seeds, returns):
+        """Update theta from returns of shape (pairs, 2), ordered like perturbed_genomes"""
+        returns = np.asarray(returns, dtype=np.float64).reshape(len(seeds), 2)
+        ranks = centered_ranks(returns)
+        weights = ranks[:, 0] - ranks[:, 1]
+        gradient = np.zeros_like(self.theta)
+        for seed, weight in zip(seeds, weights):
+            if weight != 0.0:
+                gradient += np.float32(weight) * perturbation(int(seed), len(self.theta))
+        gradient /= returns.size * self.sigma
+        self._adam_step(gradient - self.weight_decay * self.theta)
+        self.generation += 1
+        return gradient
+
+    def _adam_step(self, gradient, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        """Gradient ascent with Adam"""
+        self.steps += 1
+        self.m = beta1 * self.m + (1 - beta1) * gradient
+        self.v = beta2 * self.v + (1 - beta2) * gradient * gradient
+        step_size = self.learning_rate * np.sqrt(1 - beta2 ** self.steps) / (1 - beta1 ** self.steps)
+        self.theta += (step_size * self.m / (np.sqrt(self.v) + epsilon)).astype(np.float32)
+
+    def save(self, filepath, writer=None):
+        """Write theta, the Adam moments, the best genome and the RNG state to one .npz
+        file, atomically (in the background when a CheckpointWriter is given)"""
+        data = self._dumps()
+        if writer is None:
+            atomic_save(_write_bytes, data, filepath)
+        else:
+            writer.submit(filepath, atomic_save, _write_bytes, data, filepath)
+
+    def _dumps(self):
+        meta = {
+            "pairs": self.pairs, "sigma": self.sigma, "learning_rate": self.learning_rate,
+            "weight_decay": self.weight_decay, "steps": self.steps, "generation": self.generation,
+            "best_fitness": float(self.best_fitness), "rng_state": self.rng.bit_generator.state,
+        }
+        arrays = {"theta": self.theta, "m": self.m, "v": self.v, "meta": np.array(json.dumps(meta))}
+        if self.best_genome is not None:
+            arrays["best_genome"] = self.best_genome
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            meta = json.loads(str(data["meta"]))
+            es = cls(pairs=meta["pairs"], sigma=meta["sigma"], learning_rate=meta["learning_rate"],
+                     weight_decay=meta["weight_decay"], theta=data["theta"])
+            es.m = data["m"].copy()
+            es.v = data["v"].copy()
+            if "best_genome" in data.files:
+                es.best_genome = data["best_genome"].copy()
+        es.steps = meta["steps"]
+        es.generation = meta["generation"]
+        es.best_fitness = meta["best_fitness"]
+        es.rng.bit_generator.state = meta["rng_state"]
+        return es
@@ -0,0 +1,167 @@
+"""
+Torch-free inference for the trained networks.
+
+DodgeNet and DQNNet are small ReLU MLPs. For one state per frame, torch's
+per-call dispatch costs far more than the arithmetic. FrozenMLP holds the
+same weights as NumPy arrays and picks the same argmax action. It imports
+only NumPy, so the demos and the evaluation workers start without loading
+torch.
+
+    export_frozen(agent.policy_net, "best_rl_dqn_final.npz")  # needs torch, once
+    policy = FrozenMLP.load("best_rl_dqn_final.npz")           # NumPy only
+    action = policy.get_action(state)
+"""
+import numpy as np
+
+
+def layer_sizes(input_size=8, hidden_size=16):
+    """(in, out) sizes of the Linear layers of a DodgeNet, in parameter order"""
+    return [(input_size, hidden_size), (hidden_size, hidden_size), (hidden_size, 3)]
+
+
+def genome_size(input_size=8, hidden_size=16):
+    """Number of float32 values in a flat DodgeNet genome"""
+    return sum(n_in * n_out + n_out for n_in, n_out in layer_sizes(input_size, hidden_size))
+
+
+def param_sizes(input_size=8, hidden_size=16):
+    """Element count of every DodgeNet parameter tensor, in parameter order"""
+    sizes = []
+    for n_in, n_out in layer_sizes(input_size, hidden_size):
+        sizes.extend([n_in * n_out, n_out])
+    return sizes
+
+
+def random_genomes(count, rng, input_size=8, hidden_size=16):
+    """(count, genome_size) float32 matrix with nn.Linear's default initialisation
+    (uniform in +-1/sqrt(fan_in) for weights and biases)"""
+    columns = []
+    for n_in, n_out in layer_sizes(input_size, hidden_size):
+        bound = 1.0 / np.sqrt(n_in)
+        columns.append(rng.uniform(-bound, bound, size=(count, n_in * n_out + n_out)))
+    return np.concatenate(columns, axis=1).astype(np.float32)
+
+
+class FrozenMLP:
+    """Linear layers with ReLU in between, evaluated with NumPy.
+
+    weights[i] has shape (in, out) so a state row multiplies it directly;
+    biases[i] has shape (out,).
+    """
+    def __init__(self, weights, biases):
+        self.weights = list(weights)
+        self.biases = list(biases)
+        self._last = len(self.weights) - 1
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        """Weights of an nn.Sequential of Linear/ReLU layers, e.g. DodgeNet or DQNNet.
+        Tensors are read with .detach().cpu().numpy() (torch itself is not imported here).
+        """
+        weights, biases = [], []
+        for name, value in state_dict.items():
+            array = value.detach().cpu().numpy() if hasattr(value, "detach") else np.asarray(value)
+            array = np.ascontiguousarray(array, dtype=np.float32)
+            if name.endswith("weight"):
+                weights.append(np.ascontiguousarray(array.T))
+            elif name.endswith("bias"):
+                biases.append(array)
+        return cls(weights, biases)
+
+    @classmethod
+    def from_genome(cls, genome, input_size=8, hidden_size=16):
+        """DodgeNet weights from a flat genome. The arrays are views, so the
+        network follows later in-place changes to the genome (e.g. mutation)."""
+        weights, biases = [], []
+        offset = 0
+        for n_in, n_out in layer_sizes(input_size, hidden_size):
+            weights.append(genome[offset:offset + n_in * n_out].reshape(n_out, n_in).T)
+            offset += n_in * n_out
+            biases.append(genome[offset:offset + n_out])
+            offset += n_out
+        return cls(weights, biases)
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            count = len(data.files) // 2
+            weights = [data[f"w{i}"] for i in range(count)]
+            biases = [data[f"b{i}"] for i in range(count)]
+        return cls(weights, biases)
+
+    def save(self, filepath):
+        arrays = {}
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"w{i}"] = weight
+            arrays[f"b{i}"] = bias
+        np.savez(filepath, **arrays)
+
+    def forward(self, x):
+        """Outputs for one state (in,) or a batch (N, in)"""
+        x = np.asarray(x, dtype=np.float32)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weight + bias
+            if i < self._last:
+                x = np.maximum(x, 0.0)
+        return x
+
+    def get_action(self, state):
+        """Index of the largest output (0=left, 1=stay, 2=right)"""
+        return int(self.forward(state).argmax())
+
+    def get_actions(self, states):
+        return self.forward(states).argmax(axis=1)
+
+
+def export_frozen(network, filepath):
+    """Write a torch network's weights to a .npz FrozenMLP file and return the FrozenMLP"""
+    frozen = FrozenMLP.from_state_dict(network.state_dict())
+    frozen.save(filepath)
+    return frozen
+
+
+class PopulationNet:
+    """DodgeNets of a whole population stacked into batched weight arrays.
+
+    get_actions runs every agent's network on its own states with one batched
+    matmul per layer, instead of one forward pass per agent and per game.
+    genomes is a (P, genome_size) float32 array in DodgeNet parameter order
+    (weight then bias for every layer, as torch parameters_to_vector lays them out).
+    """
+    def __init__(self, genomes, input_size=8, hidden_size=16):
+        genomes = np.asarray(genomes, dtype=np.float32)
+        pop_size = genomes.shape[0]
+        self.weights = []
+        self.biases = []
+        offset = 0
+        for n_in, n_out in layer_sizes(input_size, hidden_size):
+            weight = genomes[:, offset:offset + n_in * n_out].reshape(pop_size, n_out, n_in)
+            offset += n_in * n_out
+            bias = genomes[:, offset:offset + n_out]
+            offset += n_out
+            # (P, in, out) so that states (P, G, in) @ weights -> (P, G, out)
+            self.weights.append(np.ascontiguousarray(weight.transpose(0, 2, 1)))
+            self.biases.append(bias[:, np.newaxis, :].copy())
+
+    @classmethod
+    def from_agents(cls, agents):
+        return cls(np.stack([agent.get_genome() for agent in agents]))
+
+    def get_actions(self, states):
+        """states: (P, 8) or (P, G, 8) array, one row (or G rows) per agent.
+        Returns actions with shape (P,) or (P, G).
+        """
+        x = np.asarray(states, dtype=np.float32)
+        single = x.ndim == 2
+        if single:
+            x = x[:, np.newaxis, :]
+        last = len(self.weights) - 1
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = np.matmul(x, weight)
+            x += bias
+            if i < last:
+                np.maximum(x, 0.0, out=x)
+        actions = x.argmax(axis=2)
+        if single:
+            actions = actions[:, 0]
+        return actions
@@ -0,0 +1,121 @@
+"""
+Opt-in per-phase timing for the game and training loops.
+
+A loop calls profiler.start() at the top of a frame and profiler.lap("phase")
+after each phase; a lap costs one perf_counter() call and a dict update, so
+the numbers stay meaningful for phases of a few microseconds. end_section()
+closes an episode or a generation and keeps its aggregates; dump_json() and
+dump_csv() write every closed section.
+
+Worker processes profile with their own PhaseProfiler and send take() back;
+the owner of the section adds it with merge(), optionally under a prefix
+(train_ai uses "games:", as those times are summed over all workers and are
+not wall time).
+
+Loops take profiler=None and use NULL_PROFILER then, whose methods do nothing.
+"""
+import csv
+import json
+import time
+
+
+class PhaseProfiler:
+    def __init__(self):
+        self.sections = []  # (label, {phase: (calls, total_seconds)}, frames)
+        self._totals = {}
+        self._calls = {}
+        self._frames = 0
+        self._last = time.perf_counter()
+
+    def start(self):
+        """Begin a frame; time before this call is not attributed to any phase"""
+        self._frames += 1
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Attribute the time since the previous start()/lap() to phase"""
+        now = time.perf_counter()
+        self._totals[phase] = self._totals.get(phase, 0.0) + (now - self._last)
+        self._calls[phase] = self._calls.get(phase, 0) + 1
+        self._last = now
+
+    def end_section(self, label):
+        """Close the current episode/generation under label and start a new one"""
+        phases, frames = self.take()
+        self.sections.append((label, phases, frames))
+
+    def take(self):
+        """({phase: (calls, total_seconds)}, frames) since the last end_section()/take(), then reset"""
+        phases = {phase: (self._calls[phase], total) for phase, total in self._totals.items()}
+        frames = self._frames
+        self._totals = {}
+        self._calls = {}
+        self._frames = 0
+        return phases, frames
+
+    def merge(self, phases, prefix=""):
+        """Add phases from another profiler's take() to the current section"""
+        for phase, (calls, total) in phases.items():
+            key = prefix + phase
+            self._totals[key] = self._totals.get(key, 0.0) + total
+            self._calls[key] = self._calls.get(key, 0) + calls
+
+    def rows(self):
+        """One dict per (section, phase): calls, total seconds, mean us per call, share of the section"""
+        rows = []
+        for label, phases, frames in self.sections:
+            section_total = sum(total for _, total in phases.values()) or 1.0
+            for phase, (calls, total) in phases.items():
+                rows.append({
+                    "section": label,
+                    "phase": phase,
+                    "frames": frames,
+                    "calls": calls,
+                    "total_s": total,
+                    "mean_us": total / calls * 1e6,
+                    "share": total / section_total,
+                })
+        return rows
+
+    def summary(self):
+        """Phases of all sections added up, largest first"""
+        totals = {}
+        for _, phases, _ in self.sections:
+            for phase, (calls, total) in phases.items():
+                prev_calls, prev_total = totals.get(phase, (0, 0.0))
+                totals[phase] = (prev_calls + calls, prev_total + total)
+        return sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+
+    def dump_json(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.rows(), f, indent=2)
+
+    def dump_csv(self, filepath):
+        fields = ["section", "phase", "frames", "calls", "total_s", "mean_us", "share"]
+        with open(filepath, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off"""
+    sections = ()
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_section(self, label):
+        pass
+
+    def take(self):
+        return {}, 0
+
+    def merge(self, phases, prefix=""):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
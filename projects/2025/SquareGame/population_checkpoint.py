@@ -0,0 +1,146 @@
+"""
+Single-file, memory-mappable checkpoint of a NeuroEvolution population.
+
+Layout:
+    8 bytes   magic b"DODGEPOP"
+    4 bytes   little-endian uint32 format version
+    4 bytes   little-endian uint32 header length
+    header    UTF-8 JSON: generation, best fitness, elite size, RNG state, user extras and
+              the dtype/shape/offset of every array
+    arrays    raw C-order arrays (genomes, fitness, scores, best_genome),
+              each starting at a 64-byte aligned offset
+
+Opening a checkpoint only reads the header; the arrays are np.memmap views,
+so reading a few rows of a 100k-genome population touches only those pages.
+Writes go to a temporary file that is renamed over the target, so a crash
+while saving leaves the previous checkpoint intact. Only NumPy is needed.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"DODGEPOP"
+VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_population(filepath, genomes, fitness, scores, generation, best_genome=None,
+                    best_fitness=0.0, elite_size=None, rng_state=None, extra=None):
+    """Write a population checkpoint atomically (temporary file + rename).
+    rng_state is a numpy BitGenerator.state dict; extra is any JSON-serializable
+    dict stored alongside (e.g. training loop state).
+    """
+    arrays = {
+        "genomes": np.ascontiguousarray(genomes, dtype=np.float32),
+        "fitness": np.ascontiguousarray(fitness, dtype=np.float64),
+        "scores": np.ascontiguousarray(scores, dtype=np.float64),
+    }
+    if best_genome is not None:
+        arrays["best_genome"] = np.ascontiguousarray(best_genome, dtype=np.float32)
+
+    header = {
+        "generation": int(generation),
+        "best_fitness": float(best_fitness),
+        "elite_size": elite_size,
+        "rng_state": rng_state,
+        "extra": extra or {},
+        "arrays": {},
+    }
+    # Offsets depend on the header length, which depends on the offsets: reserve
+    # room for the array table first, then lay the arrays out after it
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+    header_size = len(json.dumps(header).encode()) + 32 * len(arrays)
+    offset = _align(_PREFIX.size + header_size)
+    for name, array in arrays.items():
+        header["arrays"][name]["offset"] = offset
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(header_size)
+
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+
+class PopulationCheckpoint:
+    """Lazily opened checkpoint: the header is parsed, arrays are memory-mapped on access.
+
+    genomes, fitness, scores and best_genome are read-only np.memmap arrays
+    (best_genome is None if the run had no best yet). Copy what you keep after
+    the checkpoint file is replaced.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            magic, version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{filepath} is not a population checkpoint")
+            if version != VERSION:
+                raise ValueError(f"Unsupported population checkpoint version {version}")
+            header = json.loads(f.read(header_len))
+        self.generation = header["generation"]
+        self.best_fitness = header["best_fitness"]
+        self.elite_size = header["elite_size"]
+        self.rng_state = header["rng_state"]
+        self.extra = header["extra"]
+        self._layout = header["arrays"]
+        self._arrays = {}
+
+    def _array(self, name):
+        if name not in self._arrays:
+            info = self._layout[name]
+            self._arrays[name] = np.memmap(self.filepath, dtype=np.dtype(info["dtype"]), mode="r",
+                                           offset=info["offset"], shape=tuple(info["shape"]))
+        return self._arrays[name]
+
+    @property
+    def population_size(self):
+        return self._layout["genomes"]["shape"][0]
+
+    @property
+    def genome_size(self):
+        return self._layout["genomes"]["shape"][1]
+
+    @property
+    def genomes(self):
+        return self._array("genomes")
+
+    @property
+    def fitness(self):
+        return self._array("fitness")
+
+    @property
+    def scores(self):
+        return self._array("scores")
+
+    @property
+    def best_genome(self):
+        return self._array("best_genome") if "best_genome" in self._layout else None
+
+    def rows(self, start, end):
+        """Copy of genome rows [start, end); only those pages are read"""
+        return np.array(self.genomes[start:end])
+
+    def close(self):
+        self._arrays.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,9 +1,13 @@
 import random
-import collections
 import math
+import copy
+import threading
+import time
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from checkpoint_writer import atomic_save
 
 # Simple MLP policy for DQN
 class DQNNet(nn.Module):
@@ -21,80 +25,520 @@ class DQNNet(nn.Module):
         return self.net(x)
 
 class ReplayBuffer:
-    def __init__(self, capacity=100_000):
-        self.buffer = collections.deque(maxlen=capacity)
+    """Fixed-size ring buffer of transitions stored in preallocated NumPy arrays.
+
+    sample() draws integer indices and wraps the gathered rows with
+    torch.from_numpy, so no Python lists or tuples are built per transition.
+    All methods hold self.lock, so actors and a learner thread can share it.
+
+    With n_step > 1 the stored transitions are n-step ones: (s_t, a_t,
+    r_t + gamma * r_t+1 + ... + gamma^(n-1) * r_t+n-1, s_t+n, done). Pushed
+    steps wait in a per-stream window (a stream is one game, e.g. one env of a
+    DodgeVecEnv) until n steps or the end of the game are known, and the
+    returns of every stream in a push are computed together. A game's last
+    steps are stored with done=1 and their shorter return, so every stored
+    transition that bootstraps does so with gamma ** n_step. Pending windows
+    are not part of state_dict().
+    """
+    def __init__(self, capacity=100_000, state_size=8, n_step=1, gamma=0.99):
+        self.capacity = capacity
+        self.n_step = n_step
+        self.gamma = gamma
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.position = 0  # next slot to write
+        self.size = 0
+        self.rng = np.random.default_rng()
+        self.lock = threading.RLock()
+        self._window = None  # n_step > 1: (states, actions, rewards, count) of the pending steps per stream
 
     def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
+        """Store one transition (of stream 0). Returns the slots written."""
+        with self.lock:
+            if self.n_step > 1:
+                return self._push_n_step(np.asarray(state)[None], [action], [reward], np.asarray(next_state)[None],
+                                         [done], None)
+            i = self.position
+            self.states[i] = state
+            self.actions[i] = action
+            self.rewards[i] = reward
+            self.next_states[i] = next_state
+            self.dones[i] = done
+            self.position = (i + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            return (i,)
+
+    def push_batch(self, states, actions, rewards, next_states, dones, streams=None):
+        """Store n transitions at once (arrays with a leading dimension of n).
+        With n_step > 1 row i is the next step of stream streams[i] (default i,
+        so one row per env of a DodgeVecEnv); a stream may appear once per call.
+        Returns the slots written."""
+        with self.lock:
+            if self.n_step > 1:
+                return self._push_n_step(states, actions, rewards, next_states, dones, streams)
+            return self._store(states, actions, rewards, next_states, dones)
+
+    def _store(self, states, actions, rewards, next_states, dones):
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def _push_n_step(self, states, actions, rewards, next_states, dones, streams):
+        """Add one step per stream to the windows and store every n-step transition that is complete"""
+        n = self.n_step
+        streams = np.arange(len(actions)) if streams is None else np.asarray(streams)
+        self._grow_window(int(streams.max()) + 1)
+        w_states, w_actions, w_rewards, count = self._window
+        w_states[streams, count[streams]] = states
+        w_actions[streams, count[streams]] = actions
+        w_rewards[streams, count[streams]] = rewards
+        count[streams] += 1
+
+        done = np.asarray(dones, dtype=bool)
+        ready = done | (count[streams] == n)
+        if not ready.any():
+            return np.zeros(0, dtype=np.int64)
+        s = streams[ready]
+        done = done[ready]
+
+        # Discounted return from every window position to the newest step, all streams at once
+        steps = np.arange(n)
+        valid = steps < count[s][:, None]
+        window_rewards = np.where(valid, w_rewards[s], 0.0)
+        returns = np.zeros((len(s), n))
+        running = np.zeros(len(s))
+        for k in reversed(range(n)):
+            running = window_rewards[:, k] + self.gamma * running
+            returns[:, k] = running
+
+        # A finished game stores all its pending steps, a full window only its oldest one
+        rows, cols = np.nonzero(valid & (done[:, None] | (steps == 0)))
+        idx = self._store(w_states[s[rows], cols], w_actions[s[rows], cols], returns[rows, cols],
+                          np.asarray(next_states)[ready][rows], done[rows].astype(np.float32))
+
+        count[s[done]] = 0
+        slide = s[~done]
+        w_states[slide, :-1] = w_states[slide, 1:]
+        w_actions[slide, :-1] = w_actions[slide, 1:]
+        w_rewards[slide, :-1] = w_rewards[slide, 1:]
+        count[slide] -= 1
+        return idx
+
+    def _grow_window(self, num_streams):
+        if self._window is not None and len(self._window[3]) >= num_streams:
+            return
+        state_size = self.states.shape[1]
+        window = (np.zeros((num_streams, self.n_step, state_size), dtype=np.float32),
+                  np.zeros((num_streams, self.n_step), dtype=np.int64),
+                  np.zeros((num_streams, self.n_step), dtype=np.float64),
+                  np.zeros(num_streams, dtype=np.int64))
+        if self._window is not None:
+            for new, old in zip(window, self._window):
+                new[:len(old)] = old
+        self._window = window
 
     def sample(self, batch_size):
-        batch = random.sample(self.buffer, batch_size)
-        states, actions, rewards, next_states, dones = zip(*batch)
-        return (
-            torch.tensor(states, dtype=torch.float32),
-            torch.tensor(actions, dtype=torch.int64),
-            torch.tensor(rewards, dtype=torch.float32),
-            torch.tensor(next_states, dtype=torch.float32),
-            torch.tensor(dones, dtype=torch.float32),
-        )
+        return tuple(torch.from_numpy(array) for array in self.sample_arrays(batch_size))
+
+    def sample_arrays(self, batch_size):
+        """sample() as NumPy arrays, e.g. to send to another process"""
+        with self.lock:
+            idx = self.rng.integers(0, self.size, size=batch_size)
+            return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
 
     def __len__(self):
-        return len(self.buffer)
+        return self.size
+
+    def state_dict(self):
+        """Copy of the stored transitions (only the filled rows) and ring position"""
+        with self.lock:
+            n = self.size
+            return {
+                "states": self.states[:n].copy(),
+                "actions": self.actions[:n].copy(),
+                "rewards": self.rewards[:n].copy(),
+                "next_states": self.next_states[:n].copy(),
+                "dones": self.dones[:n].copy(),
+                "position": self.position,
+                "size": n,
+                "n_step": self.n_step,
+            }
+
+    def load_state_dict(self, state):
+        # Checkpoints from before n-step replay hold one-step transitions
+        if state.get("n_step", 1) != self.n_step:
+            raise ValueError(f"Replay holds {state.get('n_step', 1)}-step transitions, this buffer uses "
+                             f"n_step={self.n_step}; resume with the same n_step or without the saved replay")
+        with self.lock:
+            n = min(state["size"], self.capacity)
+            self.states[:n] = state["states"][:n]
+            self.actions[:n] = state["actions"][:n]
+            self.rewards[:n] = state["rewards"][:n]
+            self.next_states[:n] = state["next_states"][:n]
+            self.dones[:n] = state["dones"][:n]
+            self.position = state["position"] % self.capacity
+            self.size = n
+
+class SumTree:
+    """Binary sum tree in a flat array: leaves hold priorities, inner nodes their sums.
+
+    Node 1 is the root and node i has children 2i and 2i+1; the leaves are
+    nodes [leaf_count, 2 * leaf_count). update() and find() work on whole
+    batches at once, one vectorized step per tree level (O(log n)).
+    """
+    def __init__(self, capacity):
+        self.leaf_count = 1
+        while self.leaf_count < capacity:
+            self.leaf_count *= 2
+        self.depth = self.leaf_count.bit_length() - 1
+        self.nodes = np.zeros(2 * self.leaf_count, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, indices):
+        return self.nodes[indices + self.leaf_count]
+
+    def update(self, indices, priorities):
+        """Set the priority of data slots indices and refresh their ancestors"""
+        nodes = np.asarray(indices) + self.leaf_count
+        self.nodes[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        """Data slots whose cumulative priority range contains each value in [0, total)"""
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.nodes[left]
+            go_right = values >= left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaf_count
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """Replay buffer that samples transitions in proportion to |TD error| ** alpha.
+
+    New transitions get the highest priority seen so far. sample() also returns
+    importance-sampling weights (normalised to max 1, beta annealed to 1 over
+    beta_steps samples) and the sampled slots for update_priorities().
+    """
+    def __init__(self, capacity=100_000, state_size=8, alpha=0.6, beta_start=0.4,
+                 beta_steps=100_000, eps=1e-5, n_step=1, gamma=0.99):
+        super().__init__(capacity, state_size, n_step, gamma)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta_start = beta_start
+        self.beta_steps = beta_steps
+        self.eps = eps
+        self.max_priority = 1.0
+        self.sample_count = 0
+
+    def push(self, state, action, reward, next_state, done):
+        with self.lock:
+            idx = super().push(state, action, reward, next_state, done)
+            if len(idx):
+                self.tree.update(idx, self.max_priority ** self.alpha)
+            return idx
+
+    def push_batch(self, states, actions, rewards, next_states, dones, streams=None, td_errors=None):
+        """td_errors: optional initial |TD error| per transition (e.g. computed by
+        an actor, one-step buffers only); without it new transitions get the
+        highest priority seen"""
+        if td_errors is not None and self.n_step > 1:
+            raise ValueError("td_errors of pushed steps do not apply to n-step transitions")
+        with self.lock:
+            idx = super().push_batch(states, actions, rewards, next_states, dones, streams)
+            if td_errors is None:
+                self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+            else:
+                priorities = np.abs(td_errors) + self.eps
+                self.max_priority = max(self.max_priority, float(priorities.max()))
+                self.tree.update(idx, priorities ** self.alpha)
+            return idx
+
+    def sample(self, batch_size):
+        *arrays, idx = self.sample_arrays(batch_size)
+        return (*(torch.from_numpy(array) for array in arrays), idx)
+
+    def sample_arrays(self, batch_size):
+        """sample() as NumPy arrays (the last item, the slots, already is one)"""
+        with self.lock:
+            # Stratified: one uniform draw inside each of batch_size equal priority segments
+            total = self.tree.total
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+            idx = np.minimum(self.tree.find(values), self.size - 1)
+
+            beta = min(1.0, self.beta_start + (1.0 - self.beta_start) * self.sample_count / self.beta_steps)
+            self.sample_count += 1
+            probs = self.tree.get(idx) / total
+            weights = (self.size * probs) ** (-beta)
+            weights /= weights.max()
+            return (
+                self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx],
+                weights.astype(np.float32), idx,
+            )
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        with self.lock:
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+            self.tree.update(indices, priorities ** self.alpha)
+
+    def state_dict(self):
+        with self.lock:
+            state = super().state_dict()
+            state["priorities"] = self.tree.get(np.arange(state["size"]))
+            state["max_priority"] = self.max_priority
+            state["sample_count"] = self.sample_count
+            return state
+
+    def load_state_dict(self, state):
+        with self.lock:
+            super().load_state_dict(state)
+            if "priorities" in state:
+                self.tree.update(np.arange(self.size), state["priorities"][:self.size])
+                self.max_priority = state["max_priority"]
+                self.sample_count = state["sample_count"]
+            else:  # checkpoint of a uniform buffer: start every transition at priority 1
+                self.tree.update(np.arange(self.size), np.full(self.size, self.max_priority ** self.alpha))
 
 class DQNAgent:
-    def __init__(self, input_size=8, num_actions=3, device=None):
+    """Epsilon-greedy DQN with a target network.
+
+    double_dqn: targets use the action policy_net picks in next_state, valued
+    by target_net, instead of target_net's own max (less overestimation).
+    n_step: the replay buffer stores n-step returns (see ReplayBuffer) and
+    targets bootstrap with gamma ** n_step.
+    """
+    def __init__(self, input_size=8, num_actions=3, device=None, prioritized=False, double_dqn=False, n_step=1):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.policy_net = DQNNet(input_size=input_size, num_actions=num_actions).to(self.device)
         self.target_net = DQNNet(input_size=input_size, num_actions=num_actions).to(self.device)
         self.target_net.load_state_dict(self.policy_net.state_dict())
         self.target_net.eval()
         self.optimizer = optim.Adam(self.policy_net.parameters(), lr=1e-3)
+        # Held for every update of the networks and the Adam state, and while copying them,
+        # so a snapshot taken next to an AsyncLearner never mixes two training steps
+        self.lock = threading.Lock()
         self.gamma = 0.99
+        self.double_dqn = double_dqn
+        self.n_step = n_step
         self.epsilon_start = 1.0
         self.epsilon_end = 0.05
         self.epsilon_decay = 100_000  # steps
         self.step_count = 0
-        self.replay = ReplayBuffer()
+        self.rng = np.random.default_rng()
+        self.actor_net = None  # weights published by an AsyncLearner, used for acting
+        self.prioritized = prioritized
+        if prioritized:
+            self.replay = PrioritizedReplayBuffer(state_size=input_size, n_step=n_step, gamma=self.gamma)
+        else:
+            self.replay = ReplayBuffer(state_size=input_size, n_step=n_step, gamma=self.gamma)
 
-    def select_action(self, state):
-        eps_threshold = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
-                        math.exp(-1.0 * self.step_count / self.epsilon_decay)
+    def epsilon(self):
+        """Current exploration rate of the decay schedule"""
+        return self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
+            math.exp(-1.0 * self.step_count / self.epsilon_decay)
+
+    def select_action(self, state, epsilon=None):
+        """Epsilon-greedy action for one state, or an array of actions for a (N, 8) batch.
+        epsilon overrides the schedule; for a batch it may be one value per env.
+        """
+        eps_threshold = self.epsilon() if epsilon is None else epsilon
+        if np.ndim(state) == 2:
+            return self._select_actions(state, eps_threshold)
         self.step_count += 1
         if random.random() < eps_threshold:
             return random.randint(0, 2)
         with torch.no_grad():
             s = torch.tensor(state, dtype=torch.float32, device=self.device).unsqueeze(0)
-            q_values = self.policy_net(s)
+            q_values = self._acting_net()(s)
             return int(torch.argmax(q_values, dim=1).item())
 
+    def _acting_net(self):
+        return self.actor_net if self.actor_net is not None else self.policy_net
+
+    def _select_actions(self, states, eps_threshold):
+        n = len(states)
+        self.step_count += n
+        with torch.no_grad():
+            s = torch.as_tensor(np.asarray(states, dtype=np.float32), device=self.device)
+            actions = torch.argmax(self._acting_net()(s), dim=1).cpu().numpy()
+        explore = self.rng.random(n) < eps_threshold
+        actions[explore] = self.rng.integers(0, 3, size=int(explore.sum()))
+        return actions
+
     def optimize(self, batch_size=64):
         if len(self.replay) < batch_size:
             return 0.0
-        states, actions, rewards, next_states, dones = self.replay.sample(batch_size)
-        states = states.to(self.device)
-        actions = actions.to(self.device)
-        rewards = rewards.to(self.device)
-        next_states = next_states.to(self.device)
-        dones = dones.to(self.device)
-
-        q_values = self.policy_net(states).gather(1, actions.view(-1, 1)).squeeze(1)
-        with torch.no_grad():
-            next_q = self.target_net(next_states).max(1)[0]
-            target = rewards + self.gamma * next_q * (1.0 - dones)
-        loss = nn.functional.mse_loss(q_values, target)
-        self.optimizer.zero_grad()
-        loss.backward()
-        nn.utils.clip_grad_norm_(self.policy_net.parameters(), 1.0)
-        self.optimizer.step()
-        return float(loss.item())
+        batch = self.replay.sample(batch_size)
+        loss, td_errors = self.learn(batch)
+        if self.prioritized:
+            self.replay.update_priorities(batch[-1], td_errors)
+        return loss
+
+    def learn(self, batch):
+        """One gradient step on a sampled batch: (states, actions, rewards, next_states,
+        dones) tensors or arrays, plus (weights, indices) from a prioritized buffer.
+        rewards are n_step returns. Returns (loss, TD errors as a NumPy array)
+        for update_priorities().
+        """
+        states, actions, rewards, next_states, dones = (
+            torch.as_tensor(array, device=self.device) for array in batch[:5])
+
+        with self.lock:
+            q_values = self.policy_net(states).gather(1, actions.view(-1, 1)).squeeze(1)
+            with torch.no_grad():
+                if self.double_dqn:
+                    next_actions = self.policy_net(next_states).argmax(1, keepdim=True)
+                    next_q = self.target_net(next_states).gather(1, next_actions).squeeze(1)
+                else:
+                    next_q = self.target_net(next_states).max(1)[0]
+                target = rewards + self.gamma ** self.n_step * next_q * (1.0 - dones)
+            td_errors = target - q_values
+            if len(batch) > 5:
+                # Importance-sampling weights correct the bias of prioritized sampling
+                weights = torch.as_tensor(batch[5], device=self.device)
+                loss = (weights * td_errors.pow(2)).mean()
+            else:
+                loss = nn.functional.mse_loss(q_values, target)
+            self.optimizer.zero_grad()
+            loss.backward()
+            nn.utils.clip_grad_norm_(self.policy_net.parameters(), 1.0)
+            self.optimizer.step()
+        return float(loss.item()), td_errors.detach().cpu().numpy()
 
     def update_target(self):
-        self.target_net.load_state_dict(self.policy_net.state_dict())
+        with self.lock:
+            self.target_net.load_state_dict(self.policy_net.state_dict())
 
-    def save(self, path):
-        torch.save(self.policy_net.state_dict(), path)
+    def save(self, path, writer=None):
+        """Save the policy weights; with a CheckpointWriter the file is written in the background"""
+        with self.lock:
+            state = {k: v.detach().cpu().clone() for k, v in self.policy_net.state_dict().items()}
+        if writer is None:
+            atomic_save(torch.save, state, path)
+        else:
+            writer.submit(path, atomic_save, torch.save, state, path)
 
     def load(self, path):
         self.policy_net.load_state_dict(torch.load(path, map_location=self.device))
         self.update_target()
 
+    def snapshot(self, include_replay=False, extra=None):
+        """In-memory copy of everything needed to resume training: both networks,
+        the Adam state, step_count (epsilon schedule) and optionally the replay buffer"""
+        def cpu_copy(state_dict):
+            return {k: v.detach().cpu().clone() if torch.is_tensor(v) else copy.deepcopy(v)
+                    for k, v in state_dict.items()}
+
+        with self.lock:  # networks and Adam state of the same training step
+            optimizer_state = self.optimizer.state_dict()
+            snapshot = {
+                "policy_net": cpu_copy(self.policy_net.state_dict()),
+                "target_net": cpu_copy(self.target_net.state_dict()),
+                "optimizer": {
+                    "state": {k: cpu_copy(v) for k, v in optimizer_state["state"].items()},
+                    "param_groups": copy.deepcopy(optimizer_state["param_groups"]),
+                },
+                "step_count": self.step_count,
+            }
+        snapshot["replay"] = self.replay.state_dict() if include_replay else None  # has its own lock
+        snapshot["extra"] = extra or {}
+        return snapshot
+
+    def save_checkpoint(self, path, include_replay=False, extra=None, writer=None):
+        """Snapshot now, then write it (in the background when a CheckpointWriter is given)"""
+        snapshot = self.snapshot(include_replay, extra)
+        if writer is None:
+            atomic_save(torch.save, snapshot, path)
+        else:
+            writer.submit(path, atomic_save, torch.save, snapshot, path)
+
+    def load_checkpoint(self, path):
+        """Restore a save_checkpoint file. Returns its extra dict."""
+        checkpoint = torch.load(path, map_location=self.device, weights_only=False)
+        self.policy_net.load_state_dict(checkpoint["policy_net"])
+        self.target_net.load_state_dict(checkpoint["target_net"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.step_count = checkpoint["step_count"]
+        if checkpoint["replay"] is not None:
+            self.replay.load_state_dict(checkpoint["replay"])
+        return checkpoint["extra"]
+
+class AsyncLearner:
+    """Runs DQNAgent.optimize() continuously on a background thread.
+
+    Actors keep calling select_action and pushing into agent.replay; the
+    learner trains policy_net at replay_ratio updates per acted frame (it never
+    blocks the actors, it just trains as fast as it can up to that ratio).
+    Every publish_every updates a copy of policy_net is published as
+    agent.actor_net, so acting never reads weights that are being updated.
+    """
+    def __init__(self, agent, batch_size=64, replay_ratio=1.0, publish_every=100, target_update_every=1000):
+        self.agent = agent
+        self.batch_size = batch_size
+        self.replay_ratio = replay_ratio
+        self.publish_every = publish_every
+        self.target_update_every = target_update_every
+        self.updates = 0
+        self.last_loss = 0.0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dqn-learner", daemon=True)
+        self.publish()
+
+    def publish(self):
+        """Give the actors a snapshot of the current policy weights"""
+        actor_net = copy.deepcopy(self.agent.policy_net)
+        actor_net.eval()
+        self.agent.actor_net = actor_net  # attribute swap is atomic for the actors
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread, publish the final weights and re-raise a learner error"""
+        self._stop.set()
+        self._thread.join()
+        self.publish()
+        if self.error is not None:
+            raise RuntimeError("Learner thread failed") from self.error
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                due = self.agent.step_count * self.replay_ratio
+                if self.updates >= due or len(self.agent.replay) < self.batch_size:
+                    time.sleep(0.001)  # ahead of the actors: wait for more data
+                    continue
+                self.last_loss = self.agent.optimize(self.batch_size)
+                self.updates += 1
+                if self.updates % self.publish_every == 0:
+                    self.publish()
+                if self.updates % self.target_update_every == 0:
+                    self.agent.update_target()
+        except Exception as e:
+            self.error = e
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -2,7 +2,7 @@
 """
 Simple test to verify the AI system works
 """
-from ai_player import NeuroEvolution, AIAgent, DodgeNet
+from ai_player import NeuroEvolution, AIAgent, DodgeNet, PopulationNet
 import torch
 
 def test_neural_network():
@@ -51,6 +51,30 @@ def test_evolution():
     print(f"  Generation: {evo.generation}")
     print(f"  Best fitness: {evo.best_fitness}")
 
+def test_flat_population():
+    """Test that the population is one genome matrix with agent views"""
+    print("\nTesting Flat Population...")
+    import numpy as np
+    evo = NeuroEvolution(population_size=20, elite_size=4, seed=0)
+    assert evo.genomes.shape == (20, sum(p.numel() for p in DodgeNet().parameters()))
+
+    # Agent views read and write the matrix
+    evo.population[3].fitness = 7
+    assert evo.fitness[3] == 7
+    assert len(evo.population) == 20 and evo.population[-1].fitness == evo.fitness[19]
+    assert len(NeuroEvolution(population_size=100_000, elite_size=10, seed=0).population) == 100_000
+    state = [0.5, 0.0, 0.3, 0.2, -0.2, 0.6, 0.4, 0.1]
+    assert evo.population[5].get_action(state) == AIAgent(genome=evo.genomes[5].copy()).get_action(state)
+    print(f"  Agent views share the genome matrix ✓")
+
+    evo.set_fitness(np.arange(20))
+    best = evo.genomes[19].copy()
+    evo.evolve()
+    assert np.array_equal(evo.genomes[0], best), "Best genome is kept as first elite"
+    assert np.array_equal(evo.best_genome, best)
+    assert (evo.fitness == 0).all()
+    print(f"  Vectorized evolve keeps elites ✓")
+
 def test_save_load():
     """Test saving and loading agents"""
     print("\nTesting Save/Load...")
@@ -78,6 +102,741 @@ def test_save_load():
     os.remove("test_agent.pth")
     print(f"  Cleanup done ✓")
 
+def test_population_net():
+    """Test that the batched population forward pass matches each agent"""
+    print("\nTesting Population Net...")
+    import numpy as np
+    agents = [AIAgent() for _ in range(8)]
+    net = PopulationNet.from_agents(agents)
+
+    states = np.random.default_rng(0).random((8, 4, 8), dtype=np.float32)
+    actions = net.get_actions(states)
+    assert actions.shape == (8, 4)
+    for i, agent in enumerate(agents):
+        for g in range(4):
+            assert actions[i, g] == agent.get_action(states[i, g].tolist())
+    print(f"  Batched actions match per-agent actions ✓")
+
+def test_evaluator_pool():
+    """Test that the persistent worker pool scores flat genomes"""
+    print("\nTesting Evaluator Pool...")
+    import numpy as np
+    from evaluator_pool import EvaluatorPool
+    from ai_player import genome_size
+
+    genomes = np.stack([AIAgent().get_genome() for _ in range(6)])
+    assert genomes.shape == (6, genome_size())
+    with EvaluatorPool(genome_size(), capacity=8, processes=2) as pool:
+        for _ in range(2):  # same workers reused across generations
+            scores, moves = pool.evaluate(genomes, max_time=3000, seed=0)
+            assert scores.shape == (6,) and moves.shape == (6,)
+            assert (scores <= 3).all()
+    print(f"  Pool scores: {scores.tolist()} ✓")
+
+def test_replay_buffer():
+    """Test the preallocated ring-buffer replay memory"""
+    print("\nTesting Replay Buffer...")
+    from rl_dqn import ReplayBuffer
+    buffer = ReplayBuffer(capacity=5)
+    for i in range(8):
+        buffer.push([float(i)] * 8, i % 3, 1.0, [float(i + 1)] * 8, 0.0)
+    assert len(buffer) == 5, "Buffer keeps only the newest transitions"
+    assert sorted(buffer.states[:, 0].tolist()) == [3.0, 4.0, 5.0, 6.0, 7.0]
+
+    states, actions, rewards, next_states, dones = buffer.sample(16)
+    assert states.shape == (16, 8) and actions.dtype == torch.int64
+    assert (next_states[:, 0] == states[:, 0] + 1).all()
+    print(f"  Ring buffer wraps and samples batches ✓")
+
+def test_prioritized_replay():
+    """Test the sum tree and prioritized sampling"""
+    print("\nTesting Prioritized Replay...")
+    import numpy as np
+    from rl_dqn import SumTree, DQNAgent
+
+    tree = SumTree(5)
+    tree.update(np.arange(5), [1.0, 0.0, 3.0, 0.0, 4.0])
+    assert tree.total == 8.0
+    assert tree.find([0.5, 1.5, 3.9, 4.0, 7.9]).tolist() == [0, 2, 2, 4, 4]
+    print(f"  Sum tree sums and finds ✓")
+
+    agent = DQNAgent(device="cpu", prioritized=True)
+    for i in range(100):
+        agent.replay.push([0.1 * (i % 10)] * 8, i % 3, 1.0 / 60, [0.1] * 8, float(i % 10 == 0))
+    assert agent.replay.tree.total == 100.0, "New transitions get max priority"
+    loss = agent.optimize(batch_size=32)
+    assert loss >= 0.0
+    assert agent.replay.tree.total != 100.0, "TD errors update the sampled priorities"
+    print(f"  Prioritized optimize step: loss {loss:.4f} ✓")
+
+def test_batched_actor():
+    """Test batched action selection and bulk transition pushes"""
+    print("\nTesting Batched Actor...")
+    import numpy as np
+    from rl_dqn import DQNAgent
+
+    agent = DQNAgent(device="cpu")
+    states = np.random.default_rng(0).random((16, 8), dtype=np.float32)
+    actions = agent.select_action(states, epsilon=np.r_[np.zeros(8), np.ones(8)])
+    assert actions.shape == (16,) and agent.step_count == 16
+    greedy = agent.select_action(states[:8], epsilon=0.0)
+    assert (actions[:8] == greedy).all(), "Envs with epsilon 0 act greedily"
+    print(f"  Per-env epsilon actions: {actions.tolist()} ✓")
+
+    agent.replay.push_batch(states, actions, np.ones(16), states, np.zeros(16))
+    assert len(agent.replay) == 16
+    print(f"  Bulk push ✓")
+
+    from train_rl import run_vec_training
+    from vec_env import DodgeVecEnv
+    epsilons = np.array([0.0, 0.1, 0.5, 1.0])
+    used = []
+    select = agent.select_action
+    agent.select_action = lambda obs, epsilon=None: used.append(epsilon) or select(obs, epsilon)
+    run_vec_training(agent, DodgeVecEnv(4, max_time=500, auto_reset=True), 4, log_every=1000, epsilons=epsilons)
+    assert used and all(epsilon is epsilons for epsilon in used)
+    print(f"  run_vec_training acts with per-env epsilons ✓")
+
+def test_async_learner():
+    """Test that the learner thread trains and publishes actor weights"""
+    print("\nTesting Async Learner...")
+    import threading
+    import time
+    import numpy as np
+    from rl_dqn import DQNAgent, AsyncLearner
+
+    agent = DQNAgent(device="cpu")
+    states = np.random.default_rng(0).random((256, 8), dtype=np.float32)
+    agent.replay.push_batch(states, np.zeros(256, dtype=np.int64), np.ones(256), states, np.zeros(256))
+    agent.step_count = 256
+
+    with AsyncLearner(agent, replay_ratio=0.1, publish_every=5) as learner:
+        deadline = time.time() + 10
+        while learner.updates < 25 and time.time() < deadline:
+            time.sleep(0.01)
+    assert learner.updates >= 25 and learner.updates <= 26, "Learner stops at the replay ratio"
+    for actor_param, param in zip(agent.actor_net.parameters(), agent.policy_net.parameters()):
+        assert torch.equal(actor_param, param), "Final weights are published on stop"
+    print(f"  {learner.updates} background updates ✓")
+
+    # Checkpoints taken while the learner runs hold one consistent training step
+    agent.step_count = 10 ** 6
+    with AsyncLearner(agent, publish_every=5) as learner:
+        for _ in range(30):
+            snapshot = agent.snapshot()
+            steps = {float(state["step"]) for state in snapshot["optimizer"]["state"].values()}
+            assert len(steps) == 1, "Adam state of every parameter is from the same step"
+            time.sleep(0.002)
+        assert learner.updates > 0
+        held = threading.Event()
+        with agent.lock:  # a training step in progress
+            thread = threading.Thread(target=lambda: (agent.snapshot(), held.set()))
+            thread.start()
+            assert not held.wait(0.2), "snapshot() waits for the running update"
+        thread.join(timeout=5)
+        assert held.is_set()
+    print(f"  Snapshots during background training are consistent ✓")
+
+def test_observation_builder():
+    """Test the y-ordered object list and the reused state buffers"""
+    print("\nTesting Observation Builder...")
+    from dodge_sim import ObservationBuilder, update_objects
+
+    class Obj:
+        def __init__(self, x, y, speed):
+            self.x, self.y, self.speed = x, y, speed
+        def update(self):
+            self.y += self.speed
+
+    class Player:
+        x = 375
+
+    objects = [Obj(100, 598, 5), Obj(200, 300, 5), Obj(300, 290, 20)]
+    update_objects(objects)  # first object leaves the screen, third overtakes second
+    assert [obj.x for obj in objects] == [300, 200]
+    print(f"  Objects stay ordered by y ✓")
+
+    builder = ObservationBuilder()
+    state = builder.build(Player(), objects)
+    padded = builder.build(Player(), [])
+    assert state is not padded, "Consecutive states use different buffers"
+    assert abs(state[2] - 300 / 800) < 1e-6 and abs(padded[3] - (-100 / 600)) < 1e-6
+    print(f"  States built without sorting or padding objects ✓")
+
+def test_obstacle_pool():
+    """Test obstacle recycling and the y-band collision scan"""
+    print("\nTesting Obstacle Pool...")
+    from dodge_sim import ObstaclePool
+
+    pool = ObstaclePool(capacity=2)
+    first = pool.spawn(100, 700)
+    pool.update()  # falls off the screen and goes back to the free list
+    assert len(pool) == 0
+    assert pool.spawn(200, 5) is first, "Off-screen obstacles are reused"
+    print(f"  Obstacles recycled ✓")
+
+    first.y = 495.9  # pygame.Rect truncates to 495, bottom edge 535 overlaps the player
+    assert pool.collides(200 - 49) and not pool.collides(200 + 40)
+    first.y = 490.0  # bottom edge 530 only touches the player's top edge
+    assert not pool.collides(200)
+    print(f"  Collisions match pygame.Rect semantics ✓")
+
+def test_simulated_episode():
+    """Test that headless episodes use simulated time and are reproducible"""
+    print("\nTesting Simulated Episode...")
+    from train_ai import run_game_episode
+    agent = AIAgent()
+
+    result1 = run_game_episode(agent, max_time=10000, seed=123)
+    result2 = run_game_episode(agent, max_time=10000, seed=123)
+    assert result1 == result2, "Same seed should give the same episode"
+    assert result1[0] <= 10, "Score is bounded by simulated time"
+    print(f"  Episode reproducible: {result1} ✓")
+
+def test_headless_core():
+    """Test that training code runs games without importing pygame"""
+    print("\nTesting Headless Game Core...")
+    import subprocess
+    import sys
+    code = "import sys, train_ai, train_rl, evaluator_pool; print('pygame' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False", "Training modules should not import pygame"
+    print(f"  Training modules import without pygame ✓")
+
+    import random
+    from dodge_sim import DodgeGame, LEFT
+    game = DodgeGame(rng=random.Random(0))
+    while not game.act(LEFT):
+        game.update()
+        game.clock.tick()
+    assert game.player.x <= 0 and game.game_over
+    print(f"  Headless game over at score {game.score} ✓")
+
+def test_vec_env():
+    """Test that the vectorized engine runs many games in lockstep"""
+    print("\nTesting Vectorized Env...")
+    import numpy as np
+    from vec_env import DodgeVecEnv
+
+    env = DodgeVecEnv(num_envs=32, max_time=5000, seed=0)
+    obs = env.reset()
+    assert obs.shape == (32, 8)
+    print(f"  Env reset: {obs.shape} ✓")
+
+    finished = np.zeros(32, dtype=bool)
+    rng = np.random.default_rng(0)
+    while not finished.all():
+        obs, rewards, dones, info = env.step(rng.integers(0, 3, size=32))
+        finished |= dones
+    assert (info["scores"] <= 5).all(), "Scores are bounded by max_time"
+    print(f"  All games finished, scores {info['scores'].min()}-{info['scores'].max()} ✓")
+
+def test_benchmark():
+    """Test the benchmark harness and the regression check"""
+    print("\nTesting Benchmark...")
+    from benchmark import run_benchmarks, compare_results
+
+    current = run_benchmarks(["replay_sample", "evolve_50"], quick=True, verbose=False)
+    assert set(current["results"]) == {"replay_sample", "evolve_50"}
+    print(f"  Benchmarks ran: {sorted(current['results'])} ✓")
+
+    baseline = {"results": {
+        "replay_sample": dict(current["results"]["replay_sample"], value=current["results"]["replay_sample"]["value"] * 2),
+        "evolve_50": dict(current["results"]["evolve_50"], value=current["results"]["evolve_50"]["value"] * 2),
+    }}
+    regressed = {name for name, _, _, _, bad in compare_results(current, baseline, threshold=0.1) if bad}
+    assert regressed == {"replay_sample"}, "Half the throughput is a regression, half the time is not"
+    print(f"  Regressions detected against baseline ✓")
+
+def test_phase_profiler():
+    """Test per-phase timing of the episode loop and its JSON/CSV dumps"""
+    print("\nTesting Phase Profiler...")
+    import json
+    import os
+    import tempfile
+    from train_ai import run_game_episode
+    from phase_profiler import PhaseProfiler
+
+    agent = AIAgent()
+    profiler = PhaseProfiler()
+    result = run_game_episode(agent, max_time=5000, seed=7, profiler=profiler)
+    assert result == run_game_episode(agent, max_time=5000, seed=7), "Profiling must not change the episode"
+    profiler.end_section("ep 1")
+    phases = {phase for phase, _ in profiler.summary()}
+    assert {"spawn", "update", "observe", "policy", "collision"} <= phases
+    print(f"  Phases timed: {sorted(phases)} ✓")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler.dump_json(os.path.join(tmp, "profile.json"))
+        profiler.dump_csv(os.path.join(tmp, "profile.csv"))
+        with open(os.path.join(tmp, "profile.json")) as f:
+            rows = json.load(f)
+    assert abs(sum(row["share"] for row in rows) - 1.0) < 1e-6
+    print(f"  Aggregates dumped ({len(rows)} rows) ✓")
+
+    import numpy as np
+    from ai_player import random_genomes
+    from evaluator_pool import EvaluatorPool, evaluate_genomes, play_genome
+    from frozen_net import genome_size
+
+    genomes = random_genomes(6, np.random.default_rng(0))
+    games = PhaseProfiler()
+    assert play_genome(genomes[0], 5000, seed=3, profiler=games) == play_genome(genomes[0], 5000, seed=3)
+    local = evaluate_genomes(genomes, max_time=5000, seed=3)
+    assert np.array_equal(evaluate_genomes(genomes, max_time=5000, seed=3, profiler=games)[1], local[1])
+    with EvaluatorPool(genome_size(), 6, processes=2) as pool:
+        expected = pool.evaluate(genomes, max_time=5000, seed=3)
+        pooled = pool.evaluate(genomes, max_time=5000, seed=3, profiler=games)
+        pool.submit(0, genomes[0], max_time=5000, seed=3, profile=True)
+        pool.next_result(games)
+    assert np.array_equal(pooled[0], expected[0]) and np.array_equal(pooled[1], expected[1])
+    generation = PhaseProfiler()
+    generation.start()
+    generation.lap("evaluate")
+    generation.merge(games.take()[0], "games:")
+    generation.end_section("gen 1")
+    phases = {phase for phase, _ in generation.summary()}
+    assert {"evaluate", "games:spawn", "games:update", "games:policy", "games:move", "games:collision",
+            "games:observe"} <= phases
+    print(f"  Worker game phases merged into the generation ✓")
+
+def test_frozen_inference():
+    """Test that frozen NumPy networks pick the same actions as torch"""
+    print("\nTesting Frozen Inference...")
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    import numpy as np
+    from rl_dqn import DQNNet
+    from frozen_net import FrozenMLP, export_frozen
+
+    states = np.random.default_rng(0).uniform(-1, 1, size=(2000, 8)).astype(np.float32)
+    for net in (DodgeNet(), DQNNet()):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "net.npz")
+            export_frozen(net, path)
+            frozen = FrozenMLP.load(path)
+        with torch.no_grad():
+            expected = net(torch.from_numpy(states)).argmax(dim=1).numpy()
+        assert (frozen.get_actions(states) == expected).all()
+        assert frozen.get_action(states[0]) == expected[0]
+    print(f"  Same argmax as torch for DodgeNet and DQNNet ✓")
+
+    agent = AIAgent()
+    agent.mutate(mutation_rate=1.0)  # in place: the frozen view must follow
+    assert all(agent.get_action(s) == agent.network.get_action(s) for s in states[:200])
+    print(f"  AIAgent acts through a frozen view of its genome ✓")
+
+    code = "import sys, frozen_net, evaluator_pool; print('torch' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False", "Evaluation workers should not need torch"
+    print(f"  Evaluator imports without torch ✓")
+
+def test_population_checkpoint():
+    """Test saving, lazily opening and resuming a whole population"""
+    print("\nTesting Population Checkpoint...")
+    import os
+    import tempfile
+    import numpy as np
+    from population_checkpoint import PopulationCheckpoint
+
+    evo = NeuroEvolution(population_size=12, elite_size=3, seed=5)
+    evo.set_fitness(np.arange(12.0))
+    evo.evolve()
+    evo.set_fitness(np.arange(12.0)[::-1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "population.pop")
+        evo.save_checkpoint(path, extra={"best_history": [3, 4]})
+
+        with PopulationCheckpoint(path) as checkpoint:
+            assert isinstance(checkpoint.genomes, np.memmap)
+            assert np.array_equal(checkpoint.rows(4, 7), evo.genomes[4:7])
+            assert checkpoint.generation == 1 and checkpoint.extra["best_history"] == [3, 4]
+        print(f"  Rows read lazily from the memory-mapped file ✓")
+
+        resumed, _ = NeuroEvolution.load_checkpoint(path)
+    assert np.array_equal(resumed.best_genome, evo.best_genome)
+    evo.evolve()
+    resumed.evolve()
+    assert np.array_equal(resumed.genomes, evo.genomes), "Resumed run continues identically (RNG state)"
+    print(f"  Resumed population evolves exactly like the original ✓")
+
+def test_checkpoint_writer():
+    """Test background checkpoint writes and a warm DQN resume"""
+    print("\nTesting Checkpoint Writer...")
+    import os
+    import tempfile
+    import threading
+    import numpy as np
+    from checkpoint_writer import CheckpointWriter
+    from rl_dqn import DQNAgent
+
+    release = threading.Event()
+    written = []
+    writer = CheckpointWriter()
+    writer.submit("slow", release.wait)
+    writer.submit("policy", written.append, 1)
+    writer.submit("policy", written.append, 2)  # replaces the pending write of the same file
+    release.set()
+    writer.flush()
+    assert written == [2], "Only the latest snapshot per file is written"
+    print(f"  Stale snapshots skipped ✓")
+
+    agent = DQNAgent(device="cpu")
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        agent.replay.push(rng.random(8), 1, 0.1, rng.random(8), 0.0)
+    agent.optimize(batch_size=32)
+    agent.step_count = 777
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.pt")
+        agent.save_checkpoint(path, include_replay=True, extra={"episode": 3}, writer=writer)
+        writer.close()
+        resumed = DQNAgent(device="cpu")
+        extra = resumed.load_checkpoint(path)
+    assert extra == {"episode": 3} and resumed.step_count == 777 and len(resumed.replay) == 100
+    assert len(resumed.optimizer.state_dict()["state"]) > 0, "Adam moments are restored"
+    assert np.array_equal(resumed.replay.states[:100], agent.replay.states[:100])
+    print(f"  Nets, Adam state, step count and replay restored ✓")
+
+def test_spawn_tapes():
+    """Test that common-random-number spawn tapes give every agent the same games"""
+    print("\nTesting Spawn Tapes...")
+    import numpy as np
+    from ai_player import random_genomes
+    from dodge_sim import make_spawn_tapes
+    from evaluator_pool import EvaluatorPool, evaluate_genomes
+    from frozen_net import genome_size
+    from train_ai import run_game_episode
+
+    rng = np.random.default_rng(0)
+    tapes = make_spawn_tapes(2, 10000, rng)
+    genomes = random_genomes(6, rng)
+    scores, movements = evaluate_genomes(genomes, max_time=10000, tapes=tapes)
+    for i in range(6):
+        results = [run_game_episode(AIAgent(genome=genomes[i]), max_time=10000, tape=tape) for tape in tapes]
+        assert scores[i] == np.mean([score for score, _, _ in results])
+        assert movements[i] == np.mean([moves for _, _, moves in results])
+    print(f"  Single game and vectorized engine replay the same tapes ✓")
+
+    same = np.repeat(genomes[:1], 6, axis=0)
+    scores, _ = evaluate_genomes(same, max_time=10000, explore_eps=0.2, seed=1, tapes=tapes)
+    assert (scores == scores[0]).all(), "Equal genomes get equal fitness under CRN"
+    with EvaluatorPool(genome_size(), 6, processes=2) as pool:
+        pooled = pool.evaluate(genomes, max_time=10000, explore_eps=0.2, seed=1, tapes=tapes)
+    local = evaluate_genomes(genomes, max_time=10000, explore_eps=0.2, seed=1, tapes=tapes)
+    assert np.array_equal(pooled[0], local[0]) and np.array_equal(pooled[1], local[1])
+    print(f"  Equal genomes tie, pool matches in-process ✓")
+
+def test_race_genomes():
+    """Test successive-halving evaluation: extra tapes only for the best genomes"""
+    print("\nTesting Race Evaluation...")
+    import numpy as np
+    from ai_player import random_genomes
+    from dodge_sim import make_spawn_tapes
+    from evaluator_pool import evaluate_genomes, race_genomes
+
+    rng = np.random.default_rng(0)
+    tapes = make_spawn_tapes(3, 10000, rng)
+    genomes = random_genomes(20, rng)
+    stages = ((10000, 1, 1.0), (10000, 3, 0.25))
+    scores, moves, reached = race_genomes(evaluate_genomes, genomes, tapes, stages, explore_eps=0.1, seed=2)
+    assert (reached == 1).sum() == 5, "A quarter of the population plays the second stage"
+    first, _ = evaluate_genomes(genomes, max_time=10000, explore_eps=0.1, seed=2, tapes=tapes[:1])
+    full, _ = evaluate_genomes(genomes, max_time=10000, explore_eps=0.1, seed=2, tapes=tapes)
+    assert np.allclose(scores[reached == 0], first[reached == 0])
+    assert np.allclose(scores[reached == 1], full[reached == 1]), "Finalists are averaged over all tapes"
+    assert first[reached == 1].min() >= first[reached == 0].max(), "The best of stage one go on"
+    print(f"  {(reached == 1).sum()} of 20 genomes raced to {len(tapes)} tapes ✓")
+
+    for bad in (((10000, 1, 1.0), (10000, 3, 0.3)), ((10000, 0, 1.0),), ((10000, 1, 1.0), (10000, 1, 0.3))):
+        try:
+            race_genomes(evaluate_genomes, genomes, tapes[:1] if bad[-1][1] == 3 else tapes, bad)
+            assert False, f"Stages {bad} should be refused"
+        except ValueError:
+            pass
+    print("  Stages asking for missing tapes are refused ✓")
+
+def test_steady_state():
+    """Test asynchronous steady-state evolution (children replace the worst agent)"""
+    print("\nTesting Steady-State Evolution...")
+    import numpy as np
+    from evaluator_pool import EvaluatorPool, SteadyStateEvaluator, play_genome
+    from frozen_net import genome_size
+    from train_ai import run_game_episode
+
+    evo = NeuroEvolution(population_size=12, elite_size=3, seed=0)
+    score, _, moves = run_game_episode(AIAgent(genome=evo.genomes[0]), max_time=5000, explore_eps=0.1, seed=7)
+    assert play_genome(evo.genomes[0], max_time=5000, explore_eps=0.1, seed=7) == (score, moves)
+    print(f"  Scalar worker game matches run_game_episode ✓")
+
+    evo.set_fitness(np.arange(12.0))
+    assert evo.insert(evo.make_child(), 5.5) == 0, "Child replaces the worst agent"
+    assert evo.insert(evo.make_child(), 0.5) is None, "A child worse than everyone is dropped"
+    print(f"  Replace-worst insertion ✓")
+
+    for pool in (None, EvaluatorPool(genome_size(), 12, processes=2)):
+        evo = NeuroEvolution(population_size=12, elite_size=3, seed=0)
+        steady = SteadyStateEvaluator(evo, pool, max_time=5000)
+        scores, _ = steady.run(24)
+        steady.drain()
+        assert len(scores) == 24 and evo.insertions >= 24 and evo.generation == evo.insertions // 12
+        assert evo.fitness.min() > 0 and evo.best_fitness == max(evo.fitness.max(), scores.max())
+        if pool is not None:
+            pool.close()
+    print(f"  In-process and pooled steady state ✓")
+
+def test_evolution_strategies():
+    """Test seed-based ES: antithetic noise, rank shaping, replayable updates"""
+    print("\nTesting Evolution Strategies...")
+    import os
+    import tempfile
+    import numpy as np
+    from dodge_sim import make_spawn_tapes
+    from evaluator_pool import EvaluatorPool, evaluate_perturbations
+    from evolution_strategies import EvolutionStrategy, centered_ranks, perturbed_genomes
+    from frozen_net import genome_size
+
+    ranks = centered_ranks(np.array([[3.0, 1.0], [3.0, 5.0]]))
+    assert np.allclose(ranks, [[0.0, -0.5], [0.0, 0.5]]), "Ties share their mean rank"
+    es = EvolutionStrategy(pairs=4, sigma=0.1, seed=0)
+    seeds = es.ask()
+    genomes = perturbed_genomes(es.theta, seeds, es.sigma)
+    assert np.allclose(genomes[0::2] + genomes[1::2], 2 * es.theta, atol=1e-6), "Antithetic pairs"
+    print(f"  Centered ranks and antithetic perturbations ✓")
+
+    # Climb a quadratic; a copy that only sees (seeds, returns) stays in sync
+    target = np.linspace(-1, 1, genome_size()).astype(np.float32)
+    es = EvolutionStrategy(pairs=20, sigma=0.1, learning_rate=0.05, weight_decay=0.0, seed=1)
+    replica = EvolutionStrategy(pairs=20, sigma=0.1, learning_rate=0.05, weight_decay=0.0, theta=es.theta)
+    start = np.linalg.norm(es.theta - target)
+    for _ in range(100):
+        seeds = es.ask()
+        returns = -((perturbed_genomes(es.theta, seeds, es.sigma) - target) ** 2).sum(axis=1)
+        es.tell(seeds, returns)
+        replica.tell(seeds, returns)
+    assert np.linalg.norm(es.theta - target) < 0.5 * start
+    assert np.array_equal(es.theta, replica.theta)
+    print(f"  Distance to optimum {start:.2f} -> {np.linalg.norm(es.theta - target):.2f}, replica in sync ✓")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "es.npz")
+        es.save(path)
+        loaded = EvolutionStrategy.load(path)
+    assert np.array_equal(loaded.theta, es.theta) and np.array_equal(loaded.ask(), es.ask())
+
+    seeds = es.ask()[:3]
+    tapes = make_spawn_tapes(1, 5000, np.random.default_rng(2))
+    with EvaluatorPool(genome_size(), 6, processes=2) as pool:
+        pooled = pool.evaluate_perturbations(es.theta, seeds, 0.2, max_time=5000, seed=3, tapes=tapes)
+    local = evaluate_perturbations(es.theta, seeds, 0.2, max_time=5000, seed=3, tapes=tapes)
+    assert pooled[0].shape == (3, 2) and np.array_equal(pooled[0], local[0])
+    print(f"  Checkpoint round trip, pooled seed-only evaluation ✓")
+
+def test_cluster():
+    """Test TCP evaluation with workers that hang or drop out"""
+    print("\nTesting Cluster Evaluation...")
+    import multiprocessing
+    import os
+    import threading
+    import numpy as np
+    from multiprocessing.connection import Client
+    from ai_player import random_genomes
+    from cluster import AUTHKEY_ENV, Coordinator, run_worker
+    from dodge_sim import make_spawn_tapes
+    from evaluator_pool import evaluate_genomes
+
+    rng = np.random.default_rng(0)
+    genomes = random_genomes(24, rng)
+    tapes = make_spawn_tapes(1, 10000, rng)
+    expected = evaluate_genomes(genomes, max_time=10000, explore_eps=0.1, seed=4, tapes=tapes)
+    saved_key = os.environ.pop(AUTHKEY_ENV, None)
+    try:
+        Coordinator(("127.0.0.1", 0))
+        assert False, "A coordinator without a key must not start"
+    except ValueError:
+        pass
+    finally:
+        if saved_key is not None:
+            os.environ[AUTHKEY_ENV] = saved_key
+    print(f"  No default authkey ✓")
+
+    authkey = b"test-secret"
+    with Coordinator(("127.0.0.1", 0), authkey=authkey, batch_size=4, straggler_after=0.5) as coordinator:
+        # One worker takes a batch and never answers, another takes one and disconnects
+        straggler = Client(coordinator.address, authkey=authkey)
+        dropout = Client(coordinator.address, authkey=authkey)
+        assert coordinator.wait_for_workers(2, timeout=10)
+        workers = [multiprocessing.Process(target=run_worker, args=(coordinator.address, authkey)) for _ in range(2)]
+
+        def take_batch(conn):
+            conn.send(("pull", None))
+            return conn.recv()
+
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(
+            out=coordinator.evaluate(genomes, max_time=10000, explore_eps=0.1, seed=4, tapes=tapes)))
+        thread.start()
+        assert take_batch(straggler)[0] == "work" and take_batch(dropout)[0] == "work"
+        dropout.close()
+        for worker in workers:
+            worker.start()
+        thread.join(timeout=60)
+        assert not thread.is_alive(), "Generation completes despite the lost batches"
+        scores, moves = result["out"]
+        assert np.array_equal(scores, expected[0]) and np.array_equal(moves, expected[1])
+        print(f"  Dropped and straggling batches re-run, results match in-process ✓")
+        straggler.close()
+    for worker in workers:
+        worker.join(timeout=10)
+        assert worker.exitcode == 0, "Workers stop when the coordinator closes"
+    print(f"  Workers shut down cleanly ✓")
+
+def test_apex():
+    """Test Ape-X actor epsilons, weight broadcast, initial priorities and a short run"""
+    print("\nTesting Ape-X...")
+    import numpy as np
+    from apex import ApexTrainer, SharedWeights, actor_epsilons
+    from frozen_net import FrozenMLP
+    from rl_dqn import DQNAgent, PrioritizedReplayBuffer
+
+    epsilons = actor_epsilons(4)
+    assert np.isclose(epsilons[0], 0.4) and np.isclose(epsilons[-1], 0.4 ** 8)
+    assert epsilons == sorted(epsilons, reverse=True)
+    print(f"  Actor epsilons {[round(e, 4) for e in epsilons]} ✓")
+
+    agent = DQNAgent(prioritized=True)
+    weights = SharedWeights(agent.policy_net.state_dict())
+    try:
+        states = np.random.default_rng(0).standard_normal((5, 8)).astype(np.float32)
+        with torch.no_grad():
+            agent.policy_net.net[0].weight.add_(1.0)
+        weights.publish(agent.policy_net.state_dict())
+        policy, version = weights.read()
+        assert version == 2
+        expected = FrozenMLP.from_state_dict(agent.policy_net.state_dict()).forward(states)
+        assert np.allclose(policy.forward(states), expected, atol=1e-5)
+    finally:
+        weights.close(unlink=True)
+    print(f"  Published weights read back as a FrozenMLP ✓")
+
+    buffer = PrioritizedReplayBuffer(16, 8, alpha=1.0)
+    rows = np.zeros((4, 8), dtype=np.float32)
+    buffer.push_batch(rows, np.zeros(4, dtype=np.int64), np.zeros(4, dtype=np.float32), rows,
+                      np.zeros(4, dtype=np.float32), td_errors=np.array([0.0, 1.0, 3.0, 0.0]))
+    leaves = buffer.tree.nodes[buffer.tree.leaf_count:buffer.tree.leaf_count + 4]
+    assert leaves[2] > leaves[1] > leaves[0] > 0
+    assert buffer.max_priority >= 3.0
+    print(f"  Actor TD errors set the initial priorities ✓")
+
+    agent = DQNAgent(prioritized=True)
+    agent.step_count = 5000  # as restored by load_checkpoint on resume
+    with ApexTrainer(agent, num_actors=2, envs_per_actor=4, steps_per_batch=16, max_time=2000,
+                     batch_size=32, publish_every=10, seed=0) as trainer:
+        best = trainer.train(6, log_every=100)
+        trainer._processes[0].terminate()
+        trainer._processes[0].join()
+        try:
+            trainer.stats()
+            assert False, "A dead replay process should raise, not block"
+        except RuntimeError:
+            pass
+    assert trainer.updates > 0 and trainer.frames > 0
+    assert agent.step_count == 5000 + trainer.frames, "Actor frames are counted on top of the resumed steps"
+    print(f"  {trainer.updates} updates on {trainer.frames} actor frames, best {best} ✓")
+
+def test_action_repeat():
+    """Test that held actions still collide every frame and thin out the decisions"""
+    print("\nTesting Action Repeat...")
+    import numpy as np
+    from ai_player import random_genomes
+    from dodge_sim import make_spawn_tapes, STAY
+    from evaluator_pool import evaluate_genomes, play_genome
+    from rl_dqn import DQNAgent
+    from train_ai import run_game_episode
+    from train_rl import run_episode
+    from vec_env import DodgeVecEnv
+
+    rng = np.random.default_rng(0)
+    tapes = make_spawn_tapes(2, 10000, rng)
+    single = DodgeVecEnv(2, max_time=10000, tapes=tapes)
+    held = DodgeVecEnv(2, max_time=10000, tapes=tapes, action_repeat=4)
+    single.reset()
+    held.reset()
+    stay = np.full(2, STAY)
+    total_single, total_held = np.zeros(2), np.zeros(2)
+    while not (single.done.all() and held.done.all()):
+        total_held += held.step(stay)[1]
+        for _ in range(4):
+            total_single += single.step(stay)[1]
+    assert np.array_equal(held.frames, single.frames), "Games end on the same frame"
+    assert np.allclose(total_held, total_single) and (total_held < 0).all()
+    print(f"  Collisions still end games mid-repeat (frames {held.frames.tolist()}) ✓")
+
+    genomes = random_genomes(4, rng)
+    scores, movements = evaluate_genomes(genomes, max_time=10000, tapes=tapes, action_repeat=3)
+    for i in range(4):
+        results = [run_game_episode(AIAgent(genome=genomes[i]), max_time=10000, tape=tape, action_repeat=3)
+                   for tape in tapes]
+        assert scores[i] == np.mean([score for score, _, _ in results])
+        assert movements[i] == np.mean([moves for _, _, moves in results])
+        assert results[0][0] == play_genome(genomes[i], max_time=10000, tape=tapes[0], action_repeat=3)[0]
+    print(f"  Scalar and vectorized engines agree with action_repeat=3 ✓")
+
+    agent = DQNAgent()
+    score, _ = run_episode(agent, max_time_ms=3000, seed=0, action_repeat=4)
+    frames = int(score * 60) + 1
+    assert len(agent.replay) == agent.step_count <= frames // 4 + 1
+    print(f"  RL episode: {agent.step_count} decisions for ~{frames} frames ✓")
+
+def test_n_step_double_dqn():
+    """Test n-step returns built in the replay buffer and the Double DQN target"""
+    print("\nTesting N-step Replay and Double DQN...")
+    import numpy as np
+    from rl_dqn import DQNAgent, ReplayBuffer
+
+    # Two games pushed side by side; game 0 ends after 5 steps
+    buffer = ReplayBuffer(capacity=100, state_size=1, n_step=3, gamma=0.5)
+    for t in range(5):
+        states = np.array([[t], [10 + t]], dtype=np.float32)
+        buffer.push_batch(states, [0, 1], [1.0, 2.0], states + 1, [float(t == 4), 0.0])
+    n = len(buffer)
+    rows = {(int(state), int(next_state)): (reward, done) for state, next_state, reward, done in zip(
+        buffer.states[:n, 0], buffer.next_states[:n, 0], buffer.rewards[:n], buffer.dones[:n])}
+    assert rows[(0, 3)] == (1.75, 0.0) and rows[(12, 15)] == (3.5, 0.0), "Full windows: 3-step return"
+    assert rows[(3, 5)] == (1.5, 1.0) and rows[(4, 5)] == (1.0, 1.0), "A finished game flushes its tail"
+    assert n == 8, "Game 1's last two steps wait for more"
+    print(f"  Bulk n-step returns across games, tails flushed at game end ✓")
+
+    one_step = ReplayBuffer(capacity=100, state_size=1)
+    one_step.push([0.0], 0, 1.0, [1.0], 0.0)
+    try:
+        buffer.load_state_dict(one_step.state_dict())
+        assert False, "One-step replay must not load into an n-step buffer"
+    except ValueError:
+        pass
+    print(f"  Replay of another n_step is refused on resume ✓")
+
+    agent = DQNAgent(device="cpu", double_dqn=True, n_step=3)
+    with torch.no_grad():
+        for layer in (agent.policy_net.net[4], agent.target_net.net[4]):
+            layer.weight.zero_()
+        agent.policy_net.net[4].bias.copy_(torch.tensor([0.0, 0.0, 1.0]))  # policy picks action 2
+        agent.target_net.net[4].bias.copy_(torch.tensor([5.0, 0.0, 2.0]))  # target's max would be 5
+    batch = (np.zeros((1, 8), dtype=np.float32), np.array([0]), np.array([1.0], dtype=np.float32),
+             np.zeros((1, 8), dtype=np.float32), np.array([0.0], dtype=np.float32))
+    _, td_errors = agent.learn(batch)
+    assert np.isclose(td_errors[0], 1.0 + 0.99 ** 3 * 2.0 - 0.0), "Target uses target_net's value of policy's action"
+    print(f"  Double DQN target: r + gamma^n * Q_target(s', argmax Q_policy) ✓")
+
+    agent = DQNAgent(device="cpu", prioritized=True, double_dqn=True, n_step=3)
+    for i in range(100):
+        agent.replay.push([0.1 * (i % 10)] * 8, i % 3, 1.0 / 60, [0.1] * 8, float(i % 10 == 9))
+    assert len(agent.replay) == 100 and agent.optimize(batch_size=32) >= 0.0
+    print(f"  Prioritized n-step optimize step ✓")
+
 if __name__ == "__main__":
     print("=" * 50)
     print("AI System Tests")
@@ -87,7 +846,32 @@ if __name__ == "__main__":
         test_neural_network()
         test_agent()
         test_evolution()
+        test_flat_population()
         test_save_load()
+        test_population_net()
+        test_evaluator_pool()
+        test_replay_buffer()
+        test_prioritized_replay()
+        test_batched_actor()
+        test_async_learner()
+        test_observation_builder()
+        test_obstacle_pool()
+        test_simulated_episode()
+        test_headless_core()
+        test_vec_env()
+        test_benchmark()
+        test_phase_profiler()
+        test_frozen_inference()
+        test_population_checkpoint()
+        test_checkpoint_writer()
+        test_spawn_tapes()
+        test_race_genomes()
+        test_steady_state()
+        test_evolution_strategies()
+        test_cluster()
+        test_apex()
+        test_action_repeat()
+        test_n_step_double_dqn()
 
         print("\n" + "=" * 50)
         print("✓ All tests passed!")
@@ -1,197 +1,86 @@
-import pygame
+import os
 import random
 import sys
 import numpy as np
-from ai_player import NeuroEvolution
-import multiprocessing
-
-# Initialize Pygame
-pygame.init()
-
-# Constants
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-PLAYER_WIDTH = 50
-PLAYER_HEIGHT = 50
-OBJECT_WIDTH = 40
-OBJECT_HEIGHT = 40
-PLAYER_SPEED = 7
-OBJECT_SPEED = 5
-FPS = 300  # Speed up training
-
-# Colors
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-BLUE = (0, 100, 255)
-GREEN = (0, 255, 0)
-YELLOW = (255, 255, 0)
-
-# Setup screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("AI Training - Dodge Game")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
-
-class Player:
-    def __init__(self):
-        self.x = SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2
-        self.y = SCREEN_HEIGHT - PLAYER_HEIGHT - 20
-        self.width = PLAYER_WIDTH
-        self.height = PLAYER_HEIGHT
-        self.speed = PLAYER_SPEED
-
-    def move(self, direction):
-        if direction == "left" and self.x > 0:
-            self.x -= self.speed
-        elif direction == "right" and self.x < SCREEN_WIDTH - self.width:
-            self.x += self.speed
-
-    def draw(self, color=BLUE):
-        pygame.draw.rect(screen, color, (self.x, self.y, self.width, self.height))
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-class FallingObject:
-    def __init__(self, speed_multiplier=1.0):
-        self.x = random.randint(0, SCREEN_WIDTH - OBJECT_WIDTH)
-        self.y = -OBJECT_HEIGHT
-        self.width = OBJECT_WIDTH
-        self.height = OBJECT_HEIGHT
-        self.speed = OBJECT_SPEED * speed_multiplier
-
-    def update(self):
-        self.y += self.speed
-
-    def draw(self):
-        pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-    def is_off_screen(self):
-        return self.y > SCREEN_HEIGHT
-
-def check_collision(player, objects):
-    player_rect = player.get_rect()
-    for obj in objects:
-        if player_rect.colliderect(obj.get_rect()):
-            return True
-    return False
-
-def get_state(player, falling_objects):
-    """Extract state features for the neural network"""
-    # Find closest objects
-    closest_objects = sorted(falling_objects, key=lambda obj: obj.y, reverse=True)[:3]
-
-    # Pad with dummy objects if needed
-    while len(closest_objects) < 3:
-        closest_objects.append(type('obj', (), {
-            'x': SCREEN_WIDTH // 2,
-            'y': -100,
-            'speed': 0
-        })())
-
-    state = [
-        player.x / SCREEN_WIDTH,  # Player position (normalized)
-        player.x / SCREEN_WIDTH - 0.5,  # Player position relative to center
-    ]
-
-    # Add info about 2 closest objects
-    for i in range(2):
-        obj = closest_objects[i]
-        state.extend([
-            obj.x / SCREEN_WIDTH,  # Object x position
-            obj.y / SCREEN_HEIGHT,  # Object y position
-            (obj.x - player.x) / SCREEN_WIDTH,  # Relative x distance
-        ])
-
-    return state
-
-def run_game_episode(agent, max_time=30000, render=False, explore_eps=0.0):
+from ai_player import NeuroEvolution, genome_size, mutate_genomes
+from dodge_sim import DodgeGame, SimClock, SIM_FPS, make_spawn_tapes
+from evaluator_pool import EvaluatorPool, SteadyStateEvaluator, evaluate_genomes, race_genomes
+from phase_profiler import PhaseProfiler, NULL_PROFILER
+from checkpoint_writer import CheckpointWriter
+from cluster import Coordinator
+
+FPS = 300  # Playback speed when rendering (simulation itself runs at SIM_FPS)
+CAPTION = "AI Training - Dodge Game"
+
+
+def run_game_episode(agent, max_time=30000, render=False, explore_eps=0.0, seed=None, profiler=None, tape=None,
+                     action_repeat=1):
     """Run one game episode for an agent.
     Returns (score, quit_requested, movement_count).
     explore_eps: probability to take a random action to avoid premature convergence.
+    seed: optional seed for spawns and exploration, making the episode reproducible.
+    profiler: optional PhaseProfiler that times every phase of every frame.
+    tape: optional spawn tape (dodge_sim.make_spawn_tapes) to replay instead of random spawns.
+    action_repeat: frames each chosen action is held for; collisions are still
+    checked and the game is still drawn every frame.
+
+    Time is simulated with a fixed timestep (SIM_FPS), so headless episodes run as
+    fast as the CPU allows and give the same result on any machine.
     """
-    player = Player()
-    falling_objects = []
-    score = 0
-    game_over = False
-    movement_count = 0
-    start_time = pygame.time.get_ticks()
-    last_spawn_time = pygame.time.get_ticks()
-
-    while not game_over:
-        current_time = pygame.time.get_ticks()
-        elapsed = current_time - start_time
-
+    rng = random.Random(seed) if seed is not None else random
+    profiler = profiler or NULL_PROFILER
+    game = DodgeGame(SimClock(SIM_FPS), rng, tape)
+    if render:
+        from dodge_render import get_renderer, GREEN
+        renderer = get_renderer(CAPTION)
+
+    while not game.game_over:
         # Time limit
-        if elapsed > max_time:
+        if game.elapsed > max_time:
             break
-
-        score = elapsed // 1000
-
-        # Calculate difficulty
-        speed_multiplier = 1.0 + (score * 0.1)
-        spawn_interval = max(300, 1000 - score * 30)
-
-        # Spawn falling objects
-        if current_time - last_spawn_time > spawn_interval:
-            falling_objects.append(FallingObject(speed_multiplier))
-            last_spawn_time = current_time
-
-        # Update falling objects
-        for obj in falling_objects[:]:
-            obj.update()
-            if obj.is_off_screen():
-                falling_objects.remove(obj)
-
-        # Get AI action
-        state = get_state(player, falling_objects)
-        action = agent.get_action(state)
-        # Epsilon exploration (small random actions to escape local optima)
-        if explore_eps > 0.0 and random.random() < explore_eps:
-            action = random.choice([0, 1, 2])
-
-        if action == 0:
-            player.move("left")
-            movement_count += 1
-        elif action == 2:
-            player.move("right")
-            movement_count += 1
-        # action == 1 means stay
-
-        # Check collisions
-        if check_collision(player, falling_objects):
-            game_over = True
+        profiler.start()
+
+        # Score, difficulty and spawning, then falling objects
+        game.spawn()
+        profiler.lap("spawn")
+        game.obstacles.update()
+        profiler.lap("update")
+
+        # Get AI action (held for action_repeat frames)
+        if game.clock.frame % action_repeat == 0:
+            state = game.observe()
+            profiler.lap("observe")
+            action = agent.get_action(state)
+            # Epsilon exploration (small random actions to escape local optima)
+            if explore_eps > 0.0 and rng.random() < explore_eps:
+                action = rng.choice([0, 1, 2])
+            profiler.lap("policy")
+
+        # Move (action == 1 means stay) and check collisions
+        game.move_player(action)
+        game.check_collision()
+        profiler.lap("collision")
 
         # Render if requested
         if render:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return score, True, movement_count
-
-            screen.fill(WHITE)
-            player.draw(GREEN)
-            for obj in falling_objects:
-                obj.draw()
+            if renderer.poll_quit():
+                return game.score, True, game.movement_count
 
-            score_text = font.render(f"Score: {score}", True, BLACK)
-            screen.blit(score_text, (10, 10))
+            renderer.draw_game(game, GREEN)
+            renderer.draw_text(f"Score: {game.score}", (10, 10))
+            renderer.show(FPS)
+            profiler.lap("render")
 
-            pygame.display.flip()
-            clock.tick(FPS)
+        game.clock.tick()
 
-    return score, False, movement_count
+    return game.score, False, game.movement_count
 
 
-def _eval_agent_score(agent_tuple):
-    """Helper for multiprocessing: evaluate a single agent and return (score, movement_count)."""
-    (agent, max_time, explore_eps) = agent_tuple
-    score, _, movement_count = run_game_episode(agent, max_time=max_time, render=False, explore_eps=explore_eps)
-    return score, movement_count
+def agent_fitness(scores, movements):
+    """Score with an anti-idle penalty and a small movement bonus"""
+    idle_penalty = np.where(movements == 0, 5, 0)  # penalize purely idle policies
+    move_bonus = np.minimum(3, movements // 25)  # tiny bonus for making some moves
+    return np.maximum(0, scores - idle_penalty + move_bonus)
 
 
 def train_ai():
@@ -199,104 +88,184 @@ def train_ai():
     population_size = 50
     generations = 100
     max_time = 30000
+    profile = False  # set True to write per-generation phase timings to train_ai_profile.json/.csv
+    checkpoint_path = "train_ai_checkpoint.pop"  # whole population, rewritten every generation
+    resume = True  # continue from checkpoint_path if it exists
+    tapes_per_agent = 1  # spawn tapes per generation, played by every agent (0 = independent random games)
+    # Successive halving over the tapes, e.g. ((max_time, 1, 1.0), (max_time, 3, 0.3)) with
+    # tapes_per_agent = 3: everyone plays one tape, the best 30% play the other two.
+    # (max_time, tapes, share of the population) per stage; None = every agent plays every tape
+    race_stages = None
+    # Asynchronous steady-state evolution: each finished child replaces the worst agent and
+    # the worker gets the next child at once, so no core waits for the slowest agent
+    steady_state = False
+    # Evaluate on other machines: e.g. ("192.168.1.10", 6000), this host's LAN address, then
+    # start workers there with python cluster.py worker --host 192.168.1.10 --port 6000
+    # (generational mode only). Messages are pickled: use a trusted network and a secret key.
+    cluster_address = None
+    cluster_authkey = None  # shared secret of the workers; None reads DODGE_CLUSTER_AUTHKEY
+    action_repeat = 1  # frames each chosen action is held (collisions are still checked every frame)
+    if race_stages and max(num_tapes for _, num_tapes, _ in race_stages) > tapes_per_agent:
+        raise ValueError("race_stages play more tapes than tapes_per_agent makes, raise tapes_per_agent")
 
-    neuro_evo = NeuroEvolution(population_size=population_size, elite_size=10)
-
-    running = True
     best_history = []
-    for gen in range(generations):
-        if not running:
-            break
+    if resume and os.path.exists(checkpoint_path):
+        neuro_evo, extra = NeuroEvolution.load_checkpoint(checkpoint_path)
+        best_history = extra.get("best_history", [])
+        print(f"Resuming from {checkpoint_path} at generation {neuro_evo.generation + 1}")
+    else:
+        neuro_evo = NeuroEvolution(population_size=population_size, elite_size=10)
+
+    # Worker processes are started once and reused by every generation
+    if cluster_address is not None:
+        if steady_state:
+            raise ValueError("steady_state needs the local EvaluatorPool, set cluster_address = None")
+        pool = Coordinator(cluster_address, authkey=cluster_authkey)  # remote workers connect and pull batches of genomes
+        print(f"Waiting for workers on {pool.address[0]}:{pool.address[1]}...")
+    else:
+        try:
+            pool = EvaluatorPool(genome_size(), neuro_evo.population_size)
+        except Exception:
+            pool = None  # Fallback: evaluate in this process
 
-        # UI status
-        screen.fill(WHITE)
-        title = font.render("AI Training - Dodge Game", True, BLACK)
-        gen_text = font.render(f"Generation {gen + 1}/{generations}", True, BLACK)
-        hint = small_font.render("Evaluating agents... (multi-core)", True, GREEN)
-        screen.blit(title, (20, 20))
-        screen.blit(gen_text, (20, 60))
-        screen.blit(hint, (20, 100))
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                break
-        if not running:
-            break
+    profiler = PhaseProfiler() if profile else NULL_PROFILER
+    # Frame phases (spawn, update, observe, policy, collision...) of the evaluation games, timed
+    # inside the workers and merged into each generation as "games:<phase>" (summed over workers)
+    game_profiler = PhaseProfiler() if profile else None
 
-        population = neuro_evo.get_population()
+    writer = CheckpointWriter()  # saves are snapshotted here and written on a background thread
+    try:
+        steady = None
+        if steady_state:
+            if not neuro_evo.fitness.any():  # fresh population: score it once, then go asynchronous
+                evaluate = pool.evaluate if pool is not None else evaluate_genomes
+                scores, movements = evaluate(neuro_evo.genomes, max_time=max_time, action_repeat=action_repeat)
+                neuro_evo.set_fitness(agent_fitness(scores, movements), scores)
+            steady = SteadyStateEvaluator(neuro_evo, pool, agent_fitness, max_time, action_repeat=action_repeat,
+                                          profiler=game_profiler)
+
+        # Window for progress and replays (opened after the workers are forked)
+        from dodge_render import get_renderer, GREEN
+        renderer = get_renderer(CAPTION)
+
+        running = True
+        for gen in range(neuro_evo.generation, generations):
+            if not running:
+                break
+            profiler.start()
 
-        # Small exploration in early generations, then decay
-        explore_eps = max(0.0, 0.2 - 0.002 * gen)  # starts 0.2, ~0 by gen 100
+            # UI status
+            renderer.clear()
+            renderer.draw_text(CAPTION, (20, 20))
+            renderer.draw_text(f"Generation {gen + 1}/{generations}", (20, 60))
+            renderer.draw_text("Evaluating agents... (multi-core)", (20, 100), GREEN, small=True)
+            renderer.show()
 
-        # Parallel evaluation
-        results = []
-        try:
-            with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-                inputs = [(agent, max_time, explore_eps) for agent in population]
-                results = pool.map(_eval_agent_score, inputs)
-        except Exception:
-            # Fallback sequential
-            for agent in population:
-                score, quit_requested, movement_count = run_game_episode(agent, max_time=max_time, render=False, explore_eps=explore_eps)
+            if renderer.poll_quit():
+                running = False
+                break
+            profiler.lap("render")
+
+            # Small exploration in early generations, then decay
+            explore_eps = max(0.0, 0.2 - 0.002 * gen)  # starts 0.2, ~0 by gen 100
+
+            reached = None
+            if steady is not None:
+                # One generation's worth of children, each inserted as soon as it is scored
+                scores, movements = steady.run(neuro_evo.population_size, explore_eps=explore_eps)
+                profiler.lap("evaluate")
+            else:
+                # Common random numbers: every agent plays the same spawn tapes with the same
+                # exploration draws, so fitness differences come from the agents, not from luck
+                tapes, seed = None, None
+                if tapes_per_agent > 0:
+                    tapes = make_spawn_tapes(tapes_per_agent, max_time, neuro_evo.rng)
+                    seed = int(neuro_evo.rng.integers(2 ** 31))
+
+                # Parallel evaluation: the genome matrix goes to the persistent pool through shared memory
+                evaluate = pool.evaluate if pool is not None else evaluate_genomes
+                if race_stages and tapes is not None:
+                    scores, movements, reached = race_genomes(evaluate, neuro_evo.genomes, tapes, race_stages,
+                                                              agent_fitness, explore_eps=explore_eps, seed=seed,
+                                                              action_repeat=action_repeat, profiler=game_profiler)
+                else:
+                    scores, movements = evaluate(neuro_evo.genomes, max_time=max_time, explore_eps=explore_eps,
+                                                 seed=seed, tapes=tapes, action_repeat=action_repeat,
+                                                 profiler=game_profiler)
+                profiler.lap("evaluate")
+
+                neuro_evo.set_fitness(agent_fitness(scores, movements), scores)
+                profiler.lap("fitness")
+
+            if game_profiler is not None:
+                profiler.merge(game_profiler.take()[0], "games:")
+
+            # Stats
+            avg_score = float(np.mean(scores))
+            max_score = int(np.max(scores))
+            min_score = int(np.min(scores))
+            avg_moves = float(np.mean(movements))
+
+            print(f"\nGeneration {gen + 1}/{generations}")
+            print(f"  Avg Score: {avg_score:.2f} | Max: {max_score} | Min: {min_score}")
+            print(f"  Avg Moves: {avg_moves:.1f}")
+            if reached is not None:
+                print(f"  Raced: {' -> '.join(str(int((reached >= i).sum())) for i in range(len(race_stages)))} agents")
+            print(f"  Best Ever: {neuro_evo.best_fitness}")
+
+            # Track stagnation and adapt mutation by tweaking evolution params
+            best_history.append(max_score)
+            if steady is not None:
+                pass  # children were already inserted
+            elif len(best_history) >= 5 and max(best_history[-5:]) - min(best_history[-5:]) <= 1:
+                # If best score stagnates over last 5 generations, temporarily increase mutation
+                # We'll implement this by mutating the elite copies once more after evolve
+                neuro_evo.evolve()
+                mutate_genomes(neuro_evo.genomes[:neuro_evo.elite_size], 0.4, 0.5, neuro_evo.rng)
+            else:
+                neuro_evo.evolve()
+            profiler.lap("evolve")
+
+            # Resume point: everything needed to continue with the next generation
+            neuro_evo.save_checkpoint(checkpoint_path, extra={"best_history": best_history}, writer=writer)
+            profiler.lap("save")
+
+            # Show best agent every 5 generations
+            if (gen + 1) % 5 == 0:
+                print(f"\n  Showing best agent from generation {gen + 1}...")
+                best_agent = neuro_evo.get_best_agent()
+                score, quit_requested, _ = run_game_episode(best_agent, max_time=max_time, render=True, explore_eps=0.0,
+                                                            action_repeat=action_repeat)
                 if quit_requested:
                     running = False
                     break
-                results.append((score, movement_count))
-        if not running:
-            break
-
-        # Assign fitness with anti-idle penalty and small movement bonus
-        scores = []
-        movements = []
-        for agent, (score, movement_count) in zip(population, results):
-            idle_penalty = 5 if movement_count == 0 else 0  # penalize purely idle policies
-            move_bonus = min(3, movement_count // 25)  # tiny bonus for making some moves
-            fitness = max(0, score - idle_penalty + move_bonus)
-            agent.fitness = fitness
-            agent.score = score
-            scores.append(score)
-            movements.append(movement_count)
-
-        # Stats
-        avg_score = float(np.mean(scores)) if scores else 0.0
-        max_score = int(max(scores)) if scores else 0
-        min_score = int(min(scores)) if scores else 0
-        avg_moves = float(np.mean(movements)) if movements else 0.0
-
-        print(f"\nGeneration {gen + 1}/{generations}")
-        print(f"  Avg Score: {avg_score:.2f} | Max: {max_score} | Min: {min_score}")
-        print(f"  Avg Moves: {avg_moves:.1f}")
-        print(f"  Best Ever: {neuro_evo.best_fitness}")
-
-        # Track stagnation and adapt mutation by tweaking evolution params
-        best_history.append(max_score)
-        if len(best_history) >= 5 and max(best_history[-5:]) - min(best_history[-5:]) <= 1:
-            # If best score stagnates over last 5 generations, temporarily increase mutation
-            # We'll implement this by mutating the elite copies once more after evolve
-            neuro_evo.evolve()
-            for agent in neuro_evo.get_population()[:neuro_evo.elite_size]:
-                agent.mutate(mutation_rate=0.4, mutation_scale=0.5)
-        else:
-            neuro_evo.evolve()
-
-        # Show best agent every 5 generations
-        if (gen + 1) % 5 == 0:
-            print(f"\n  Showing best agent from generation {gen + 1}...")
-            best_agent = neuro_evo.get_best_agent()
-            score, quit_requested, _ = run_game_episode(best_agent, max_time=max_time, render=True, explore_eps=0.0)
-            if quit_requested:
-                running = False
-                break
-            print(f"  Best agent scored: {score}")
-
-        # Save best agent every 10 generations
-        if (gen + 1) % 10 == 0:
-            neuro_evo.save_best(f"best_agent_gen_{gen + 1}.pth")
+                print(f"  Best agent scored: {score}")
+                profiler.lap("render")
+
+            # Save best agent every 10 generations
+            if (gen + 1) % 10 == 0:
+                neuro_evo.save_best(f"best_agent_gen_{gen + 1}.pth", writer=writer)
+                profiler.lap("save")
+                if profile:
+                    profiler.dump_json("train_ai_profile.json")
+                    profiler.dump_csv("train_ai_profile.csv")
+            profiler.end_section(f"gen {gen + 1}")
+
+        if profile:
+            profiler.dump_json("train_ai_profile.json")
+            profiler.dump_csv("train_ai_profile.csv")
+
+        if steady is not None:
+            steady.drain()
+    finally:
+        # stop the workers and free their shared memory, finish pending checkpoint writes
+        if pool is not None:
+            pool.close()
+        writer.close()
 
     # Final save
     neuro_evo.save_best("best_agent_final.pth")
+    neuro_evo.export_best("best_agent_final.npz")  # frozen copy for torch-free demos
     print("\nTraining complete!")
     print(f"Best fitness achieved: {neuro_evo.best_fitness}")
 
@@ -304,7 +273,8 @@ def train_ai():
     print("\nDemonstrating best agent...")
     best_agent = neuro_evo.get_best_agent()
     while running:
-        score, quit_requested, _ = run_game_episode(best_agent, max_time=60000, render=True, explore_eps=0.0)
+        score, quit_requested, _ = run_game_episode(best_agent, max_time=60000, render=True, explore_eps=0.0,
+                                                    action_repeat=action_repeat)
         if quit_requested:
             break
         print(f"Demo score: {score}")
@@ -313,5 +283,6 @@ if __name__ == "__main__":
     try:
         train_ai()
     finally:
-        pygame.quit()
+        from dodge_render import close_renderer
+        close_renderer()
         sys.exit()
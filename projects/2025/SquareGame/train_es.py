@@ -0,0 +1,77 @@
+import os
+import sys
+import numpy as np
+from dodge_sim import make_spawn_tapes
+from evaluator_pool import EvaluatorPool, evaluate_perturbations, play_genome
+from evolution_strategies import EvolutionStrategy
+from frozen_net import FrozenMLP, genome_size
+from checkpoint_writer import CheckpointWriter
+from train_ai import agent_fitness, run_game_episode
+
+
+def train_es():
+    """Train the DodgeNet weights with Evolution Strategies (evolution_strategies.py)."""
+    pairs = 50  # antithetic perturbation pairs per generation
+    generations = 100
+    max_time = 30000
+    tapes_per_agent = 3  # spawn tapes every perturbation plays (common random numbers)
+    render_every = 0  # set to e.g. 10 to watch the current theta play every 10 generations
+    checkpoint_path = "train_es_checkpoint.npz"  # theta, Adam state and RNG, every generation
+    resume = True  # continue from checkpoint_path if it exists
+
+    if resume and os.path.exists(checkpoint_path):
+        es = EvolutionStrategy.load(checkpoint_path)
+        print(f"Resuming from {checkpoint_path} at generation {es.generation + 1}")
+    else:
+        es = EvolutionStrategy(pairs=pairs)
+
+    # Workers get theta once per generation and only the perturbation seeds
+    try:
+        pool = EvaluatorPool(genome_size(), es.population_size)
+        evaluate = pool.evaluate_perturbations
+    except Exception:
+        pool = None  # Fallback: evaluate in this process
+        evaluate = evaluate_perturbations
+
+    writer = CheckpointWriter()
+    try:
+        for gen in range(es.generation, generations):
+            tapes = make_spawn_tapes(tapes_per_agent, max_time, es.rng)
+            seed = int(es.rng.integers(2 ** 31))
+            seeds = es.ask()
+            scores, movements = evaluate(es.theta, seeds, es.sigma, max_time=max_time, seed=seed, tapes=tapes)
+            es.tell(seeds, agent_fitness(scores, movements))
+
+            # Score the updated mean on the same tapes; keep the best one seen
+            theta_score = np.mean([play_genome(es.theta, max_time, tape=tape)[0] for tape in tapes])
+            if theta_score > es.best_fitness:
+                es.best_fitness = float(theta_score)
+                es.best_genome = es.theta.copy()
+
+            print(f"\nGeneration {gen + 1}/{generations}")
+            print(f"  Avg Score: {scores.mean():.2f} | Max: {int(scores.max())} | Theta: {theta_score:.1f}")
+            print(f"  Best Ever: {es.best_fitness}")
+            es.save(checkpoint_path, writer=writer)
+
+            if render_every and (gen + 1) % render_every == 0:
+                _, quit_requested, _ = run_game_episode(FrozenMLP.from_genome(es.theta), max_time=max_time,
+                                                        render=True)
+                if quit_requested:
+                    break
+    finally:
+        if pool is not None:
+            pool.close()
+        writer.close()  # finish pending checkpoint writes
+
+    best = es.best_genome if es.best_genome is not None else es.theta
+    FrozenMLP.from_genome(best).save("best_es_final.npz")
+    print("\nES training complete!")
+    print(f"Best theta score: {es.best_fitness} (saved to best_es_final.npz, python demo_ai.py best_es_final.npz)")
+
+if __name__ == "__main__":
+    try:
+        train_es()
+    finally:
+        from dodge_render import close_renderer
+        close_renderer()
+        sys.exit()
@@ -1,159 +1,152 @@
-import pygame
+import os
 import random
 import sys
+import numpy as np
 import torch
-from rl_dqn import DQNAgent
-
-# Pygame setup (headless training uses minimal rendering)
-pygame.init()
-SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
-PLAYER_WIDTH, PLAYER_HEIGHT = 50, 50
-OBJECT_WIDTH, OBJECT_HEIGHT = 40, 40
-PLAYER_SPEED = 7
-OBJECT_SPEED = 5
-FPS = 600  # fast headless
-
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("RL Training - Dodge Game")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
-
-class Player:
-    def __init__(self):
-        self.x = SCREEN_WIDTH // 2 - PLAYER_WIDTH // 2
-        self.y = SCREEN_HEIGHT - PLAYER_HEIGHT - 20
-        self.width = PLAYER_WIDTH
-        self.height = PLAYER_HEIGHT
-        self.speed = PLAYER_SPEED
-
-    def move(self, direction):
-        if direction == 0 and self.x > 0:  # left
-            self.x -= self.speed
-        elif direction == 2 and self.x < SCREEN_WIDTH - self.width:  # right
-            self.x += self.speed
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-class FallingObject:
-    def __init__(self, speed_multiplier=1.0):
-        self.x = random.randint(0, SCREEN_WIDTH - OBJECT_WIDTH)
-        self.y = -OBJECT_HEIGHT
-        self.width = OBJECT_WIDTH
-        self.height = OBJECT_HEIGHT
-        self.speed = OBJECT_SPEED * speed_multiplier
-
-    def update(self):
-        self.y += self.speed
-
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-    def is_off_screen(self):
-        return self.y > SCREEN_HEIGHT
-
-# Env helpers
-
-def get_state(player, falling_objects):
-    closest = sorted(falling_objects, key=lambda obj: obj.y, reverse=True)[:3]
-    while len(closest) < 3:
-        closest.append(type('obj', (), {'x': SCREEN_WIDTH // 2, 'y': -100})())
-    state = [
-        player.x / SCREEN_WIDTH,
-        player.x / SCREEN_WIDTH - 0.5,
-    ]
-    for i in range(2):
-        obj = closest[i]
-        state.extend([
-            obj.x / SCREEN_WIDTH,
-            obj.y / SCREEN_HEIGHT,
-            (obj.x - player.x) / SCREEN_WIDTH,
-        ])
-    return state
-
-def check_collision(player, objects):
-    rect = player.get_rect()
-    for obj in objects:
-        if rect.colliderect(obj.get_rect()):
-            return True
-    return False
+from rl_dqn import DQNAgent, AsyncLearner
+from apex import ApexTrainer, actor_epsilons
+from frozen_net import export_frozen
+from dodge_sim import DodgeGame, SimClock, SIM_FPS, SURVIVE_REWARD_PER_SECOND
+from vec_env import DodgeVecEnv
+from phase_profiler import PhaseProfiler, NULL_PROFILER
+from checkpoint_writer import CheckpointWriter
+
+FPS = SIM_FPS  # simulated frames per second (fixed timestep, not wall clock)
+CAPTION = "RL Training - Dodge Game"
 
 # Episode rollouts
 
-def run_episode(agent, max_time_ms=30000, render=False):
-    player = Player()
-    objs = []
-    start = pygame.time.get_ticks()
-    last_spawn = start
+def run_episode(agent, max_time_ms=30000, render=False, seed=None, learner=None, profiler=None, action_repeat=1):
+    """Play one training episode on a fixed-timestep simulated clock.
+    seed: optional seed for the spawn sequence.
+    learner: a running AsyncLearner; when given, this loop only acts and pushes
+    transitions and leaves optimize()/target updates to the learner thread.
+    profiler: optional PhaseProfiler that times every phase of every frame.
+    action_repeat: frames each selected action is held for. A transition then
+    spans those frames with their summed reward, and select_action/optimize run
+    once per transition; collisions are still checked every frame.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    profiler = profiler or NULL_PROFILER
+    game = DodgeGame(SimClock(FPS), rng)
+    if render:
+        from dodge_render import get_renderer, GREEN
+        renderer = get_renderer(CAPTION)
+    pending = None  # (state, action, reward) waiting for the next frame's state
     score = 0.0
     steps = 0
     total_loss = 0.0
 
     done = False
     while not done:
-        now = pygame.time.get_ticks()
-        elapsed = now - start
+        elapsed = game.elapsed
         if elapsed >= max_time_ms:
             done = True
         score = elapsed / 1000.0
-
-        # difficulty
-        speed_mul = 1.0 + (score * 0.1)
-        spawn_interval = max(300, 1000 - int(score) * 30)
-        if now - last_spawn > spawn_interval:
-            objs.append(FallingObject(speed_mul))
-            last_spawn = now
-
-        for obj in list(objs):
-            obj.update()
-            if obj.is_off_screen():
-                objs.remove(obj)
-
-        # observe
-        state = get_state(player, objs)
-        action = agent.select_action(state)
-
-        # act
-        player.move(action)
-
-        # reward shaping
-        reward = 1.0 / FPS  # ~1 per second
-        if check_collision(player, objs):
+        profiler.start()
+
+        # difficulty and spawning, then falling objects
+        game.spawn()
+        profiler.lap("spawn")
+        game.obstacles.update()
+        profiler.lap("update")
+
+        # observe; this state is also the next_state of the previous transition
+        decide = game.clock.frame % action_repeat == 0
+        if decide:
+            state = game.observe()
+            profiler.lap("observe")
+            if pending is not None:
+                agent.replay.push(*pending, state, 0.0)
+                profiler.lap("replay_push")
+            action = agent.select_action(state)
+            reward = 0.0
+            profiler.lap("policy")
+
+        # act, with reward shaping
+        reward += SURVIVE_REWARD_PER_SECOND / FPS  # 1/600 per frame, as before the simulated clock
+        game.move_player(action)
+        if game.check_collision():
             reward -= 50.0
             done = True
-
-        next_state = get_state(player, objs)
-        agent.replay.push(state, action, reward, next_state, float(done))
-        loss = agent.optimize(batch_size=64)
-        total_loss += loss
-        steps += 1
-
-        if agent.step_count % 1000 == 0:
-            agent.update_target()
+        profiler.lap("collision")
+
+        if done:
+            agent.replay.push(state, action, reward, game.observe(), 1.0)
+            profiler.lap("replay_push")
+        else:
+            pending = (state, action, reward)
+        if decide:  # one optimize() per transition
+            steps += 1
+            if learner is None:
+                loss = agent.optimize(batch_size=64)
+                total_loss += loss
+
+                if agent.step_count % 1000 == 0:
+                    agent.update_target()
+                profiler.lap("optimize")
 
         if render:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return score, True
-            screen.fill(WHITE)
+            if renderer.poll_quit():
+                return score, True
             # minimal draw
-            pygame.draw.rect(screen, GREEN, player.get_rect())
-            for obj in objs:
-                pygame.draw.rect(screen, RED, obj.get_rect())
-            info = small_font.render(f"Score {int(score)} | steps {steps}", True, BLACK)
-            screen.blit(info, (10, 10))
-            pygame.display.flip()
-            clock.tick(60)
+            renderer.draw_game(game, GREEN)
+            renderer.draw_text(f"Score {int(score)} | steps {steps}", (10, 10), small=True)
+            renderer.show(60)
+            profiler.lap("render")
+
+        game.clock.tick()
 
     return score, False
 
 
+def run_vec_training(agent, env, episodes, log_every=50, learner=None, writer=None,
+                     checkpoint_path=None, save_replay=False, start_episode=0, best=0, epsilons=None):
+    """Train on a DodgeVecEnv (auto_reset=True) until `episodes` games have ended.
+    Every step acts in all games with one batched select_action, pushes all
+    transitions at once and runs one optimize() (unless a running AsyncLearner
+    is given, which then does all the training). Returns the best score.
+    Every log_every games the policy (and a full checkpoint when checkpoint_path
+    is set) is saved, through writer when one is given.
+    epsilons: optional exploration rate per env (e.g. apex.actor_epsilons(env.num_envs)),
+    used instead of the decaying schedule; None gives every env the schedule's epsilon.
+    """
+    obs = env.reset()
+    finished = start_episode
+    next_log = (finished // log_every + 1) * log_every
+    last_sync = agent.step_count // 1000
+    while finished < episodes:
+        actions = agent.select_action(obs, epsilon=epsilons)
+        next_obs, rewards, dones, info = env.step(actions)
+
+        # Terminal transitions keep the last observation of the finished game
+        next_states = next_obs
+        if dones.any():
+            next_states = next_obs.copy()
+            next_states[dones] = info["final_obs"][dones]
+        agent.replay.push_batch(obs, actions, rewards, next_states, dones.astype(np.float32))
+        if learner is None:
+            agent.optimize(batch_size=64)
+
+            if agent.step_count // 1000 > last_sync:
+                agent.update_target()
+                last_sync = agent.step_count // 1000
+
+        if dones.any():
+            scores = info["scores"][dones]
+            finished += len(scores)
+            best = max(best, int(scores.max()))
+            if finished >= next_log:
+                print(f"Ep {finished}/{episodes} | last {int(scores[-1])} | best {best} | epsilon step {agent.step_count} | envs {env.num_envs}")
+                agent.save("best_rl_dqn.pth", writer=writer)
+                if checkpoint_path:
+                    agent.save_checkpoint(checkpoint_path, include_replay=save_replay,
+                                          extra={"episode": finished, "best": best}, writer=writer)
+                next_log += log_every
+        obs = next_obs
+    return best
+
+
 def train_rl():
     # Detect device and report GPU info
     use_cuda = torch.cuda.is_available()
@@ -167,38 +160,88 @@ def train_rl():
     else:
         print("RL: Using CPU (CUDA not available)")
 
-    agent = DQNAgent(device=device)
+    prioritized_replay = False  # set True to replay rare collisions more often (sum-tree PER)
+    apex_actors = 0  # set to e.g. 4 for Ape-X: actor processes feed a replay process, this one only learns
+    double_dqn = False  # set True for Double DQN targets (policy_net picks the next action, target_net values it)
+    n_step = 1  # set to e.g. 3 for n-step replay returns (start a new checkpoint: stored transitions are n-step)
+    agent = DQNAgent(device=device, prioritized=prioritized_replay or apex_actors > 0,
+                     double_dqn=double_dqn, n_step=n_step)
 
     episodes = 2000
     render_every = 0  # set to e.g. 100 to visualize
-
-    running = True
+    num_envs = 1  # set to e.g. 16 to step that many headless games per action batch
+    per_env_epsilon = False  # set True (with num_envs > 1) for fixed Ape-X style epsilons per env, no schedule
+    async_learner = False  # set True to run optimize() on a background learner thread
+    action_repeat = 1  # frames each action is held: k times fewer select_action/optimize calls per game second
+    profile = False  # set True to write per-episode phase timings to train_rl_profile.json/.csv
+    profiler = PhaseProfiler() if profile else None
+    checkpoint_path = "train_rl_checkpoint.pt"  # nets, Adam state and step_count, every 50 episodes
+    save_replay = False  # set True to also checkpoint the replay buffer (larger files, warmer resume)
+    resume = True  # continue from checkpoint_path if it exists
+
+    start_episode = 0
     best = 0
-    for ep in range(1, episodes + 1):
-        # Handle quit
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                break
-        if not running:
-            break
-
-        render = (render_every and ep % render_every == 0)
-        score, quit_requested = run_episode(agent, max_time_ms=20000, render=render)
-        if quit_requested:
-            break
-        best = max(best, int(score))
-
-        if ep % 50 == 0:
-            print(f"Ep {ep}/{episodes} | last {int(score)} | best {best} | epsilon step {agent.step_count} | device {device}")
-            agent.save("best_rl_dqn.pth")
+    if resume and os.path.exists(checkpoint_path):
+        extra = agent.load_checkpoint(checkpoint_path)
+        start_episode = extra.get("episode", 0)
+        best = extra.get("best", 0)
+        print(f"Resuming from {checkpoint_path} after episode {start_episode} (step {agent.step_count})")
+
+    renderer = None
+    if render_every:
+        from dodge_render import get_renderer
+        renderer = get_renderer(CAPTION)
+
+    writer = CheckpointWriter()  # saves are snapshotted here and written on a background thread
+    learner = AsyncLearner(agent).start() if async_learner else None
+    try:
+        if apex_actors:
+            # Replay lives in its own process here, so save_replay does not apply
+            with ApexTrainer(agent, num_actors=apex_actors, max_time=20000, action_repeat=action_repeat) as trainer:
+                best = trainer.train(episodes, writer=writer, checkpoint_path=checkpoint_path,
+                                     start_episode=start_episode, best=best)
+        elif num_envs > 1:
+            env = DodgeVecEnv(num_envs, max_time=20000, auto_reset=True, action_repeat=action_repeat)
+            epsilons = np.array(actor_epsilons(num_envs)) if per_env_epsilon else None
+            best = run_vec_training(agent, env, episodes, learner=learner, writer=writer,
+                                    checkpoint_path=checkpoint_path, save_replay=save_replay,
+                                    start_episode=start_episode, best=best, epsilons=epsilons)
+        else:
+            for ep in range(start_episode + 1, episodes + 1):
+                # Handle quit
+                if renderer is not None and renderer.poll_quit():
+                    break
+
+                render = (render_every and ep % render_every == 0)
+                score, quit_requested = run_episode(agent, max_time_ms=20000, render=render, learner=learner,
+                                                    profiler=profiler, action_repeat=action_repeat)
+                if quit_requested:
+                    break
+                if profiler is not None:
+                    profiler.end_section(f"ep {ep}")
+                best = max(best, int(score))
+
+                if ep % 50 == 0:
+                    print(f"Ep {ep}/{episodes} | last {int(score)} | best {best} | epsilon step {agent.step_count} | device {device}")
+                    agent.save("best_rl_dqn.pth", writer=writer)
+                    agent.save_checkpoint(checkpoint_path, include_replay=save_replay,
+                                          extra={"episode": ep, "best": best}, writer=writer)
+                    if profiler is not None:
+                        profiler.dump_json("train_rl_profile.json")
+                        profiler.dump_csv("train_rl_profile.csv")
+    finally:
+        if learner is not None:
+            learner.stop()
+        writer.close()  # finish pending checkpoint writes
 
     print("RL training complete. Best score:", best)
     agent.save("best_rl_dqn_final.pth")
+    export_frozen(agent.policy_net, "best_rl_dqn_final.npz")  # frozen copy for torch-free demos
 
 if __name__ == "__main__":
     try:
         train_rl()
     finally:
-        pygame.quit()
+        from dodge_render import close_renderer
+        close_renderer()
         sys.exit()
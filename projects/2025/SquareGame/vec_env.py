@@ -0,0 +1,195 @@
+"""
+Vectorized Dodge game: N independent games stepped in lockstep with NumPy.
+
+Game state lives in struct-of-arrays buffers (one row per game, one column per
+falling-object slot) so that spawning, movement, culling and collision are a
+handful of array operations per frame instead of Python method calls per object.
+The rules are the ones of dodge_sim.DodgeGame:
+- score = simulated seconds survived, difficulty ramps with the integer score
+- one object spawns when more than spawn_interval ms passed since the last one
+- objects move, then off-screen objects are removed, then the agent observes
+- the player moves, then collides against the objects (pygame.Rect semantics)
+"""
+import numpy as np
+from phase_profiler import NULL_PROFILER
+from dodge_sim import (
+    SCREEN_WIDTH, SCREEN_HEIGHT, PLAYER_WIDTH, PLAYER_HEIGHT, PLAYER_START_X, PLAYER_Y,
+    OBJECT_WIDTH, OBJECT_HEIGHT, PLAYER_SPEED, OBJECT_SPEED, SIM_FPS, SURVIVE_REWARD_PER_SECOND,
+)
+
+COLLISION_PENALTY = 50.0
+
+
+class DodgeVecEnv:
+    """Steps num_envs Dodge games at once.
+
+    reset() returns the first observations, shape (num_envs, 8).
+    step(actions) takes one action per game (0=left, 1=stay, 2=right) and returns
+    (observations, rewards, dones, info). info holds the per-game "scores" and
+    "moves" of the episode that just finished (or is running), and "final_obs"
+    with the last observation of finished games when auto_reset is on.
+
+    With auto_reset=False a finished game stays finished (its rows are ignored)
+    until reset() is called again; with auto_reset=True it restarts immediately.
+
+    tapes: optional (T, spawns) array from dodge_sim.make_spawn_tapes. Game i
+    then takes its spawn x positions from tape tape_index[i] (default i % T)
+    instead of the env's rng, and replays it from the start on every reset.
+
+    action_repeat: frames every step() holds the given actions for. Collisions
+    and the time limit are still checked every frame (a game that ends early
+    stops there), and the rewards of those frames are summed.
+
+    profiler: optional PhaseProfiler; step() then laps the move, collision,
+    spawn, update and observe phases of its frames (the caller calls start()).
+    """
+    observation_size = 8
+
+    def __init__(self, num_envs, max_time=30000, fps=SIM_FPS, seed=None,
+                 auto_reset=False, max_objects=32, tapes=None, tape_index=None, action_repeat=1, profiler=None):
+        self.num_envs = num_envs
+        self.action_repeat = action_repeat
+        self.profiler = profiler or NULL_PROFILER
+        self.max_time = max_time
+        self.dt_ms = 1000.0 / fps
+        self.survive_reward = SURVIVE_REWARD_PER_SECOND / fps
+        self.auto_reset = auto_reset
+        self.max_objects = max_objects
+        self.rng = np.random.default_rng(seed)
+        self.tapes = None if tapes is None else np.asarray(tapes)
+        if self.tapes is not None and tape_index is None:
+            tape_index = np.arange(num_envs) % len(self.tapes)
+        self.tape_index = tape_index
+
+        n, c = num_envs, max_objects
+        self.frames = np.zeros(n, dtype=np.int64)
+        self.last_spawn = np.zeros(n, dtype=np.int64)
+        self.spawn_count = np.zeros(n, dtype=np.int64)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)
+        self.player_x = np.zeros(n, dtype=np.int64)
+        self.done = np.ones(n, dtype=bool)
+        self.obj_x = np.zeros((n, c), dtype=np.float64)
+        self.obj_y = np.zeros((n, c), dtype=np.float64)
+        self.obj_speed = np.zeros((n, c), dtype=np.float64)
+        self.obj_alive = np.zeros((n, c), dtype=bool)
+        self.obs = np.zeros((n, self.observation_size), dtype=np.float32)
+        self._rows = np.arange(n)
+
+    def reset(self, mask=None):
+        """Start new episodes for every game (or only where mask is True)"""
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.frames[mask] = 0
+        self.last_spawn[mask] = 0
+        self.spawn_count[mask] = 0
+        self.scores[mask] = 0
+        self.moves[mask] = 0
+        self.player_x[mask] = PLAYER_START_X
+        self.done[mask] = False
+        self.obj_alive[mask] = False
+        self._begin_frame(mask)
+        self._observe()
+        return self.obs.copy()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        active = ~self.done
+        rewards = np.zeros(self.num_envs)
+        for _ in range(self.action_repeat):
+            running = ~self.done
+            if not running.any():
+                break
+            self._play_frame(actions, running, rewards)
+        self._observe()
+        self.profiler.lap("observe")
+
+        dones = active & self.done
+        info = {"scores": self.scores.copy(), "moves": self.moves.copy()}
+        obs = self.obs.copy()
+        if self.auto_reset and dones.any():
+            info["final_obs"] = obs
+            obs = obs.copy()
+            obs[dones] = self.reset(dones)[dones]
+        return obs, rewards, dones, info
+
+    def _play_frame(self, actions, active, rewards):
+        """Move, collide and advance the active games by one frame, adding to rewards"""
+        # Player movement (same wall checks as Player.move)
+        left = active & (actions == 0) & (self.player_x > 0)
+        right = active & (actions == 2) & (self.player_x < SCREEN_WIDTH - PLAYER_WIDTH)
+        self.player_x[left] -= PLAYER_SPEED
+        self.player_x[right] += PLAYER_SPEED
+        self.moves[active & (actions != 1)] += 1
+        self.profiler.lap("move")
+
+        # Collisions against the objects of the current frame
+        collided = active & self._collisions()
+        rewards[active] += self.survive_reward
+        rewards[collided] -= COLLISION_PENALTY
+        self.done[collided] = True
+        self.profiler.lap("collision")
+
+        # Advance surviving games to their next frame
+        alive = active & ~collided
+        self.frames[alive] += 1
+        self._begin_frame(alive)
+
+    def _begin_frame(self, mask):
+        """Time limit, score, difficulty, spawning and object update for masked games"""
+        elapsed = (self.frames * self.dt_ms).astype(np.int64)
+        timed_out = mask & (elapsed > self.max_time)
+        self.done[timed_out] = True
+        mask = mask & ~timed_out
+
+        self.scores[mask] = elapsed[mask] // 1000
+        speed_multiplier = 1.0 + self.scores * 0.1
+        spawn_interval = np.maximum(300, 1000 - self.scores * 30)
+
+        spawn = mask & (elapsed - self.last_spawn > spawn_interval)
+        if spawn.any():
+            rows = self._rows[spawn]
+            slots = np.argmin(self.obj_alive[rows], axis=1)  # first free slot
+            if self.tapes is not None:
+                self.obj_x[rows, slots] = self.tapes[self.tape_index[rows], self.spawn_count[rows]]
+            else:
+                self.obj_x[rows, slots] = self.rng.integers(0, SCREEN_WIDTH - OBJECT_WIDTH + 1, size=len(rows))
+            self.spawn_count[rows] += 1
+            self.obj_y[rows, slots] = -OBJECT_HEIGHT
+            self.obj_speed[rows, slots] = OBJECT_SPEED * speed_multiplier[rows]
+            self.obj_alive[rows, slots] = True
+            self.last_spawn[rows] = elapsed[rows]
+        self.profiler.lap("spawn")
+
+        moving = self.obj_alive & mask[:, None]
+        self.obj_y += np.where(moving, self.obj_speed, 0.0)
+        self.obj_alive &= ~(moving & (self.obj_y > SCREEN_HEIGHT))
+        self.profiler.lap("update")
+
+    def _collisions(self):
+        """AABB test of every player against its objects (pygame.Rect truncates to int)"""
+        px = self.player_x[:, None]
+        oy = np.trunc(self.obj_y)
+        hit = (
+            self.obj_alive
+            & (px < self.obj_x + OBJECT_WIDTH) & (self.obj_x < px + PLAYER_WIDTH)
+            & (PLAYER_Y < oy + OBJECT_HEIGHT) & (oy < PLAYER_Y + PLAYER_HEIGHT)
+        )
+        return hit.any(axis=1)
+
+    def _observe(self):
+        """Same 8 features as get_state: player position and the 2 lowest objects"""
+        y = np.where(self.obj_alive, self.obj_y, -np.inf)
+        px = self.player_x.astype(np.float64)
+        obs = self.obs
+        obs[:, 0] = px / SCREEN_WIDTH
+        obs[:, 1] = px / SCREEN_WIDTH - 0.5
+        for i in range(2):
+            slots = np.argmax(y, axis=1)
+            present = self.obj_alive[self._rows, slots] & np.isfinite(y[self._rows, slots])
+            ox = np.where(present, self.obj_x[self._rows, slots], SCREEN_WIDTH // 2)
+            oy = np.where(present, self.obj_y[self._rows, slots], -100)
+            obs[:, 2 + 3 * i] = ox / SCREEN_WIDTH
+            obs[:, 3 + 3 * i] = oy / SCREEN_HEIGHT
+            obs[:, 4 + 3 * i] = (ox - px) / SCREEN_WIDTH
+            y[self._rows, slots] = -np.inf